@@ -1,25 +1,37 @@
 # Home.py
 from pathlib import Path
 import json
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 # Local imports
-from utils.paths import schema_png, DATA_DIR
+from utils.paths import (schema_png, asset_exists, asset_stat, data_source, graph_crops, graphml, read_asset,
+                         image_input, watch_path, DATA_DIR, REC_STORE_DIR)
+from utils import (compare, diagnostics, evidence, fingerprint, metrics, recs, recstore, rescoring, snapshots,
+                   thumbs, vectors)
+from utils.subgraph import evidence_index
 
 # --- Streamlit page setup ---
 st.set_page_config(
     page_title="Climate-Adaptive Variety + Irrigation + Smart Nutrients recommender",
     layout="wide"
 )
+metrics.start_exporter()
+
+# --- Hidden diagnostics view (timings, cache counters, memory): open the app as /?diagnostics=1 ---
+if "diagnostics" in st.query_params:
+    diagnostics.render()
+    st.stop()
 
 # --- Title ---
 st.title("🌿 Climate-Adaptive Variety + Irrigation + Smart Nutrients Recommender")
 
 # --- Hero: show ONLY the schema image ---
 schema = schema_png()
-if schema.exists():
-    st.image(str(schema), caption="Knowledge Graph — Metagraph (schema overview)", use_container_width=True)
+if asset_exists(schema):
+    st.image(image_input(thumbs.thumbnail(schema, 1280)), caption="Knowledge Graph — Metagraph (schema overview)",
+             use_container_width=True)
 else:
     st.info("Schema PNG not found in the data directory (schema_metagraph.png).")
 
@@ -55,58 +67,180 @@ st.markdown("## Explore the recommendation tables")
 # Where the parquet/json live (WSL path via utils.paths.DATA_DIR)
 REC_DIR: Path = DATA_DIR
 
-FILES = {
-    "default": REC_DIR / "recommendations.parquet",
-    "balanced": REC_DIR / "recommendations_balanced.parquet",
-    "low_water": REC_DIR / "recommendations_low_water.parquet",
-    "low_n": REC_DIR / "recommendations_low_n.parquet",
-    "disease_aware": REC_DIR / "recommendations_disease_aware.parquet",
-    "robust": REC_DIR / "recommendations_robust.parquet",
-}
+FILES = recs.preset_files(REC_DIR)
 META_PATH = REC_DIR / "recommendations_meta.json"
+DICTS_PATH = REC_DIR / recs.DICTS_NAME
+
+ZONEMAP_PATH = REC_STORE_DIR / recstore.ZONEMAP_NAME
+
+@metrics.cache_resource(show_spinner=False)
+def get_watcher() -> fingerprint.DataWatcher:
+    """
+    One background watcher per process over the presets, the meta JSON and the store's zone map.
+    Cached loaders below take its version tokens as arguments, so a changed file only
+    invalidates its own entries.
+    """
+    def refresh(name, path, fp):
+        # Re-convert a changed preset off the request path; the snapshot is swapped in atomically
+        if name in FILES and fp is not None and asset_exists(FILES[name]):
+            snapshots.ensure(FILES[name])
 
-existing_presets = [k for k, p in FILES.items() if p.exists()]
+    # With an asset pack every data file is watched through the pack itself
+    paths = {name: watch_path(p) for name, p in {**FILES, "meta": META_PATH}.items()}
+    paths["zonemap"] = ZONEMAP_PATH
+    return fingerprint.DataWatcher(paths, interval=5.0, on_change=refresh).start()
 
-@st.cache_data(show_spinner=False)
-def load_one(kind: str) -> pd.DataFrame:
-    """Load one parquet and tag its source. Returns empty DF if not found."""
+watcher = get_watcher()
+existing_presets = [k for k in FILES if watcher.exists(k) and asset_exists(FILES[k])]
+
+# Pseudo-preset whose plan_score/rank_plan are recomputed from user weights
+CUSTOM = "custom"
+
+@metrics.cache_resource(show_spinner=False, max_entries=12)
+def load_one(kind: str, version: str = "") -> pd.DataFrame:
+    """
+    Load one parquet and tag its source. Returns empty DF if not found.
+    Loaded once per process and shared by every session: treat as read-only.
+    Backed by a memory-mapped Arrow snapshot when the cache directory is writable.
+    """
     p = FILES.get(kind)
-    if not p or not p.exists():
+    if not p or not asset_exists(p):
         return pd.DataFrame()
-    df = pd.read_parquet(p)
-    df["__source__"] = kind
-    return df
+    snap = snapshots.ensure(p)
+    df = snapshots.load_frame(snap, kind) if snap else recs.load_compact(p, kind)
+    return recs.register_shared(kind, df)
 
-@st.cache_data(show_spinner=False)
-def load_all(kinds: list[str]) -> pd.DataFrame:
-    dfs = [load_one(k) for k in kinds]
+@metrics.cache_resource(show_spinner=False, max_entries=8)
+def load_all(kinds: tuple[str, ...], versions: tuple[str, ...] = ()) -> pd.DataFrame:
+    """All requested presets stacked (categoricals kept by unioning their categories). Read-only."""
+    dfs = [load_one(k, v) for k, v in zip(kinds, versions or [""] * len(kinds))]
     dfs = [d for d in dfs if not d.empty]
     if not dfs:
         return pd.DataFrame()
-    return pd.concat(dfs, ignore_index=True, sort=False)
+    return recs.register_shared("+".join(kinds), recs.concat_compact(dfs))
+
+def data_version(kind: str) -> str:
+    """Version token of a watched file; changes when its content changes."""
+    return watcher.version(kind)
+
+def zonemap_version() -> str:
+    """Changes whenever `python -m utils.recstore build` rewrites the zone map."""
+    return watcher.version("zonemap")
+
+@metrics.cache_data(show_spinner=False, max_entries=4)
+def load_zonemap(version: str) -> pd.DataFrame:
+    return recstore.read_zonemap(REC_STORE_DIR)
+
+@metrics.cache_data(show_spinner=False, max_entries=4)
+def load_store_sources(version: str) -> dict:
+    return recstore.read_sources(REC_STORE_DIR)
+
+def store_zonemap(kind: str, version: str) -> pd.DataFrame | None:
+    """The zone map if the partitioned store is current for `kind`, else None (use the parquet)."""
+    zonemap = load_zonemap(version)
+    if not recstore.has_preset(zonemap, kind):
+        return None
+    if kind not in recstore.fresh_presets(zonemap, load_store_sources(version), {kind: FILES[kind]}):
+        return None
+    return zonemap
+
+@metrics.cache_data(show_spinner=False, max_entries=32)
+def load_choices(kind: str, version: str = "", store_version: str = "") -> dict:
+    """Crop/region/year selector values from the per-preset dictionary sidecar."""
+    p = FILES.get(kind)
+    if not p or not asset_exists(p):
+        return {c: [] for c in recs.SELECTOR_COLS}
+    return recs.preset_dictionary(kind, p, DICTS_PATH, zonemap=store_zonemap(kind, store_version))
+
+@metrics.cache_data(show_spinner=False, max_entries=64)
+def query_view(kind: str, crop, region, years: tuple, min_score: float, hide_nans: bool,
+               version: str = "", store_version: str = "") -> pd.DataFrame:
+    """
+    Push the widget selections down into the scan; returns only matching rows.
+    Uses the partitioned store when it has been built for `kind`, else the memory-mapped
+    Arrow snapshot, else the preset parquet.
+    """
+    p = FILES.get(kind)
+    if not p or not asset_exists(p):
+        return pd.DataFrame()
+    opts = dict(
+        columns=[c for c in recs.PREFERRED_COLS if c != "__source__"],
+        crop=crop, region=region, years=years, min_score=min_score,
+        drop_na=recs.KEY_COLS if hide_nans else (),
+    )
+    zonemap = store_zonemap(kind, store_version)
+    if zonemap is not None:
+        df = recstore.query(zonemap, kind, REC_STORE_DIR, **opts)
+    else:
+        snap = snapshots.ensure(p)
+        df = recs.query(snapshots.open_dataset(snap) if snap else p, **opts)
+    df["__source__"] = kind
+    return recs.compact(df)
+
+@metrics.cache_resource(show_spinner=False, max_entries=16)
+def ranking(kind: str, crop, region, years: tuple, min_score: float, hide_nans: bool,
+            version: str = "", store_version: str = "") -> recs.RankIndex:
+    """Shared ranking index over one filtered view; paging never re-sorts the whole view."""
+    return recs.RankIndex(query_view(kind, crop, region, years, min_score, hide_nans, version, store_version))
 
-@st.cache_data(show_spinner=False)
-def load_meta() -> dict:
-    if META_PATH.exists():
+@metrics.cache_resource(show_spinner=False, max_entries=4)
+def load_rescorer(kind: str, version: str = "") -> rescoring.Rescorer:
+    """Normalised feature matrix of one preset, shared by every session."""
+    return rescoring.Rescorer(load_one(kind, version))
+
+@metrics.cache_resource(show_spinner=False, max_entries=16)
+def custom_ranking(kind: str, weights: tuple, crop, region, years: tuple, min_score: float,
+                   hide_nans: bool, version: str = "") -> recs.RankIndex:
+    """Ranking index over `kind` re-scored with `weights` ((column, weight) pairs)."""
+    df = load_one(kind, version)
+    if df.empty:
+        return recs.RankIndex(df)
+    score, rank = load_rescorer(kind, version).score(dict(weights))
+    mask = recs.frame_mask(df, crop=crop, region=region, years=years, min_score=min_score,
+                           drop_na=recs.KEY_COLS if hide_nans else (), score=score)
+    view = df.loc[mask, [c for c in recs.PREFERRED_COLS if c in df.columns]].copy()
+    view["plan_score"] = score[mask]
+    view["rank_plan"] = rank[mask]
+    view["__source__"] = pd.Categorical.from_codes(np.zeros(len(view), dtype=np.int8), categories=[CUSTOM])
+    return recs.RankIndex(view)
+
+@metrics.cache_resource(show_spinner=False, max_entries=8)
+def comparison(kinds: tuple[str, ...], versions: tuple[str, ...] = ()) -> pd.DataFrame:
+    """Presets aligned on (region, crop, variety, year); computed once per preset set. Read-only."""
+    return compare.compare_presets(load_all(kinds, versions), list(kinds), baseline=kinds[0] if kinds else None)
+
+@metrics.cache_resource(show_spinner="Indexing knowledge-graph entities…", max_entries=1)
+def vector_index(stamps: tuple) -> vectors.VectorIndex:
+    """Entity search over every crop graph; `stamps` ((crop, stat) pairs) keys re-exports."""
+    return vectors.VectorIndex([crop for crop, _ in stamps])
+
+@metrics.cache_data(show_spinner=False, max_entries=2)
+def load_meta(version: str = "") -> dict:
+    if asset_exists(META_PATH):
         try:
-            return json.loads(META_PATH.read_text())
+            return json.loads(read_asset(META_PATH))
         except Exception:
             return {}
     return {}
 
-if not existing_presets:
+if data_source().stamp() is None:
+    st.error(f"Data directory not found: {DATA_DIR} (is the drive mounted? EUROAGRI_DATA_DIR overrides it)")
+elif not existing_presets:
     st.warning(f"No recommendation parquet files found in: {REC_DIR}")
 else:
     # --- Controls
     c1, c2, c3, c4 = st.columns([1.2, 1.2, 1.2, 1])
     with c1:
-        sel_preset = st.selectbox("Preset (table source)", existing_presets, index=0)
-    df = load_one(sel_preset)
+        sel_preset = st.selectbox("Preset (table source)", existing_presets + [CUSTOM], index=0)
+    # Custom weights re-score the default table (or the first preset available)
+    is_custom = sel_preset == CUSTOM
+    table_kind = ("default" if "default" in existing_presets else existing_presets[0]) if is_custom else sel_preset
+    choices = load_choices(table_kind, data_version(table_kind), store_version=zonemap_version())
 
     # Derive choices safely
-    crops = sorted(df["crop"].dropna().unique().tolist()) if "crop" in df else []
-    regions = sorted(df["region_iso"].dropna().unique().tolist()) if "region_iso" in df else []
-    years = sorted(df["year"].dropna().unique().tolist()) if "year" in df else []
+    crops = choices.get("crop", [])
+    regions = choices.get("region_iso", [])
+    years = choices.get("year", [])
 
     with c2:
         sel_crop = st.selectbox("Crop", crops, index=0 if crops else None)
@@ -118,55 +252,176 @@ else:
     # Optional: multi-year filter if present
     sel_years = st.multiselect("Years (optional)", years, default=years)
 
+    if is_custom:
+        with st.expander(f"Custom objective weights (re-scoring the **{table_kind}** table)", expanded=True):
+            st.caption("Irrigation and N/P/K are costs: a higher weight rewards plans that need less of them.")
+            wcols = st.columns(4)
+            weights = tuple(
+                (f, wcols[i % 4].slider(f, 0.0, 1.0, 0.5 if i < 3 else 0.25, 0.05, key=f"w_{f}"))
+                for i, f in enumerate(rescoring.FEATURES)
+            )
+
     # Hide-NaNs toggle: drops rows with NaNs in the key columns that exist
     st.markdown("**Display options**")
     hide_nans = st.checkbox("Only show rows without NaNs in key columns", value=True)
 
-    # Build a row mask
-    mask = pd.Series(True, index=df.index)
-    if "crop" in df and sel_crop:
-        mask &= df["crop"].eq(sel_crop)
-    if "region_iso" in df and sel_region:
-        mask &= df["region_iso"].eq(sel_region)
-    if "year" in df and sel_years:
-        mask &= df["year"].isin(sel_years)
-    if "plan_score" in df:
-        mask &= df["plan_score"].fillna(0) >= float(min_score)
-
-    # Columns to show (only those that exist)
-    preferred_cols = [
-        "region_iso", "crop", "variety", "year",
-        "plan_score", "variety_fit", "disease_fit",
-        "irr_total_mm", "etc_total_mm", "pe_total_mm", "rainfall_share",
-        "n_kg_ha", "p_kg_ha", "k_kg_ha", "net_irrig_mm_sel",
-        "robust_score", "rank_plan", "__source__"
-    ]
-    show_cols = [c for c in preferred_cols if c in df.columns]
-
-    view = df.loc[mask, show_cols]
-
-    # If requested, drop rows with NaNs in "key" columns that actually exist here
-    key_cols = [c for c in ["plan_score", "disease_fit", "variety_fit"] if c in view.columns]
-    if hide_nans and key_cols:
-        view = view.dropna(subset=key_cols)
-
-    # Sort by score if it exists
-    if "plan_score" in view.columns:
-        view = view.sort_values("plan_score", ascending=False)
-
-    # Show a compact table (trim to first 500 rows for responsiveness)
-    st.dataframe(view.head(500), use_container_width=True)
+    if is_custom:
+        # Whole table re-scored in NumPy; memoised per weight vector
+        index = custom_ranking(table_kind, weights, sel_crop, sel_region, tuple(sel_years), float(min_score),
+                               hide_nans, version=data_version(table_kind))
+    else:
+        # Filters and column projection are pushed into the parquet scan
+        index = ranking(sel_preset, sel_crop, sel_region, tuple(sel_years), float(min_score), hide_nans,
+                        version=data_version(sel_preset), store_version=zonemap_version())
+
+    # --- Paging: each page is cut from a partition of the sort key, not a full sort
+    sort_cols = [c for c in recs.SORT_KEYS if c in index.df.columns]
+    p1, p2, p3, p4 = st.columns([1.2, 1.2, 1, 1])
+    with p1:
+        sort_col = st.selectbox("Sort by", sort_cols, index=0) if sort_cols else None
+    with p2:
+        best_first = st.radio("Order", ["Best first", "Worst first"], horizontal=True) == "Best first"
+    with p3:
+        page_size = st.selectbox("Rows per page", [50, 100, 250, 500], index=1)
+    n_pages = max(1, (len(index) + page_size - 1) // page_size)
+    with p4:
+        page_no = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+
+    smaller_is_better = recs.SORT_KEYS.get(sort_col, False)
+    ascending = smaller_is_better if best_first else not smaller_is_better
+    page = index.page(sort_col, ascending, int(page_no) - 1, page_size)
+
+    first = (int(page_no) - 1) * page_size
+    st.caption(f"Rows {first + 1 if len(page) else 0}–{first + len(page)} of {len(index)}  •  Page {page_no}/{n_pages}")
+    st.dataframe(page, use_container_width=True)
+
+    # --- Why this plan: the evidence subgraph behind one row of the current page
+    st.markdown("### Why this plan?")
+    if page.empty:
+        st.caption("No rows on this page.")
+    elif st.toggle("Show the knowledge-graph evidence for a row", value=False):
+        def describe_row(i):
+            r = page.iloc[i]
+            parts = [str(r.get(c)) for c in ("region_iso", "crop", "variety", "year") if c in page.columns]
+            score = f" · plan_score {r['plan_score']:.3f}" if "plan_score" in page.columns and pd.notna(r["plan_score"]) else ""
+            return f"#{first + i + 1} · " + " / ".join(parts) + score
+
+        pick = st.selectbox("Row to explain", range(len(page)), format_func=describe_row)
+        row = page.iloc[pick]
+        ev_crop = str(row["crop"]) if "crop" in page.columns else sel_crop
+        ev_region = row["region_iso"] if "region_iso" in page.columns else sel_region
+        ev_year = int(row["year"]) if "year" in page.columns and pd.notna(row["year"]) else None
+        ev_variety = row["variety"] if "variety" in page.columns and pd.notna(row["variety"]) else None
+        try:
+            retriever = evidence_index(ev_crop, asset_stat(graphml(ev_crop)))
+        except ValueError as e:
+            retriever = None
+            st.warning(str(e))
+        if retriever is None:
+            st.info(f"No knowledge graph export for this crop ({graphml(ev_crop).name}).")
+        else:
+            ev = retriever.pack(ev_region, ev_year, ev_variety)
+            if not ev.found:
+                st.info(f"Region {ev_region} is not in the {ev_crop} knowledge graph.")
+            else:
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Climate windows", ev.counts.get("climate", 0))
+                m2.metric("Stage windows", ev.counts.get("stage", 0))
+                m3.metric("Water-balance nodes", ev.counts.get("water", 0))
+                m4.metric("Disease-risk nodes", ev.counts.get("disease", 0))
+                tabs = st.tabs(["Stage timing", "Water balance", "Disease risk", "Plans & varieties",
+                                "Evidence subgraph", "Supporting rows"])
+                for tab, sections in zip(tabs[:4], (["climate", "stage"], ["water"], ["disease"], ["plan", "variety"])):
+                    with tab:
+                        frames = [ev.section(s) for s in sections]
+                        frames = [f for f in frames if not f.empty]
+                        if frames:
+                            st.dataframe(pd.concat(frames, ignore_index=True), hide_index=True, use_container_width=True)
+                        else:
+                            st.caption("Nothing of this kind is linked to the selection in the graph.")
+                with tabs[4]:
+                    st.dataframe(ev.edges, hide_index=True, use_container_width=True)
+                with tabs[5]:
+                    st.dataframe(evidence.supporting_rows(index.df, ev_region, ev_year, ev_crop),
+                                 hide_index=True, use_container_width=True)
+                note = " Some hops were capped; the densest neighbourhoods are truncated." if ev.truncated else ""
+                st.caption(f"Evidence for {ev.region}: {len(ev.nodes)} nodes, {len(ev.edges)} edges, "
+                           f"retrieved in {ev.elapsed_ms:.1f} ms.{note}")
+
+    # --- Semantic search over graph entities, linked back to the recommendation rows
+    st.markdown("### Search the knowledge graph")
+    query = st.text_input("Regions, varieties, stages, plans…", placeholder="e.g. flowering, BE21, drought tolerant")
+    if query.strip():
+        ent_crops = graph_crops()
+        if not ent_crops:
+            st.info("No graph_crop_{crop}.graphml exports found to search.")
+        else:
+            vindex = vector_index(tuple((c, asset_stat(graphml(c))) for c in ent_crops))
+            hits = vindex.search(query, k=10)
+            if hits.empty:
+                st.caption("No matching entities.")
+            else:
+                st.dataframe(hits.drop(columns="node"), hide_index=True, use_container_width=True)
+                hit_no = st.selectbox("Linked recommendation rows for", range(len(hits)),
+                                      format_func=lambda i: f"{hits.at[i, 'id']} ({hits.at[i, 'type']}, {hits.at[i, 'crop']})")
+                hit = hits.iloc[hit_no]
+                keys = evidence.anchors(vindex.graphs[hit["crop"]], int(hit["node"]))
+                if not keys.get("region") and not keys.get("variety"):
+                    st.caption("This entity is not tied to a region or variety, so no rows are linked.")
+                else:
+                    linked = evidence.supporting_rows(load_one(table_kind, data_version(table_kind)),
+                                                      keys.get("region"), keys.get("year"), hit["crop"],
+                                                      keys.get("variety"))
+                    st.caption(f"{len(linked)} rows in **{table_kind}** for "
+                               + ", ".join(f"{k}={v}" for k, v in keys.items() if v is not None))
+                    st.dataframe(linked.head(200), hide_index=True, use_container_width=True)
+
+    # --- Cross-preset comparison (same crop/region/year filters)
+    st.markdown("### Compare presets side by side")
+    # Starts empty: loading every compared preset should not be part of the first paint
+    cmp_kinds = st.multiselect("Presets to compare (first one is the baseline for rank deltas)",
+                               existing_presets, default=[], placeholder="e.g. default, low_water, robust")
+    if len(cmp_kinds) >= 2:
+        with metrics.span("compare.presets"):
+            cmp = comparison(tuple(cmp_kinds), tuple(data_version(k) for k in cmp_kinds))
+            cmp_mask = recs.frame_mask(cmp, crop=sel_crop, region=sel_region, years=tuple(sel_years))
+            cmp_index = recs.RankIndex(cmp.loc[cmp_mask])
+        top_n = st.slider("Plans shown (largest plan_score spread first)", 10, 500, 50, 10)
+        st.dataframe(cmp_index.page("plan_score_spread", False, 0, top_n), hide_index=True,
+                     use_container_width=True)
+        st.caption(f"{len(cmp_index)} plans matched across {len(cmp_kinds)} presets. "
+                   f"rank_delta < 0 means the plan ranks better than under **{cmp_kinds[0]}**.")
+    else:
+        st.caption("Pick at least two presets to compare.")
 
     with st.expander("About these tables (source files & schema)", expanded=False):
-        st.write("Directory:", str(REC_DIR))
-        st.write("Loaded file:", str(FILES[sel_preset]))
+        st.write("Data source:", data_source().describe())
+        st.write("Loaded file:", str(FILES[table_kind]))
+        if is_custom:
+            st.caption("Custom preset: plan_score and rank_plan are recomputed in memory from the weights above.")
+        elif store_zonemap(sel_preset, zonemap_version()) is not None:
+            st.write("Served from partitioned store:", str(REC_STORE_DIR))
+        else:
+            st.caption("Tip: run `python -m utils.recstore build` to partition the presets for faster filtering.")
         st.caption(
             "Tip: switch presets to see how the same (region, crop) looks under different objectives, "
             "and toggle **Only show rows without NaNs** to hide sparse columns."
         )
-        meta = load_meta()
+        meta = load_meta(data_version("meta"))
         if meta:
             st.json(meta)
 
+        footprint = recs.shared_footprint()
+        rss = recs.process_rss()
+        st.markdown("**Shared in-memory frames (this process)**")
+        if footprint.empty:
+            st.caption("No preset is held in shared memory yet.")
+        else:
+            st.dataframe(footprint, hide_index=True, use_container_width=True)
+        if rss is not None:
+            st.caption(f"Process resident memory: {rss / 2**20:,.0f} MB")
+        st.caption(f"Data generation {watcher.generation} (files in {REC_DIR} are re-checked every "
+                   f"{watcher.interval:.0f}s; changed presets reload without a restart).")
+
 # --- Navigation reminder ---
 st.info("Use the left sidebar to navigate between **The Blueprint**, **Season Snapshots**, and **Climate Snapshots**.")
\ No newline at end of file
@@ -0,0 +1,255 @@
+# benchmarks/run.py
+"""
+Headless benchmark suite for the app's hot paths.
+
+Generates (or reuses) a synthetic data tree for a size profile, points the
+app at it through EUROAGRI_DATA_DIR / EUROAGRI_CACHE_DIR, then times:
+
+* preset loading (parquet decode, Arrow snapshot convert and map),
+* selector construction, filter pushdown and in-memory masks, paging,
+* asset discovery through the manifest, thumbnail rendering,
+* graph compile, evidence retrieval and entity search,
+* full script runs of Home.py and every page through Streamlit's AppTest.
+
+Results are written as JSON. `--save` stores them as the profile's baseline
+under benchmarks/baselines/; `--compare` fails (exit 1) when a benchmark's
+median got slower than the baseline by more than the tolerance.
+
+    python -m benchmarks.run --profile small --save
+    python -m benchmarks.run --profile small --compare
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+PROFILES = {
+    "small": {"rows": 10**5, "pngs": 10**3},
+    "medium": {"rows": 10**6, "pngs": 10**4},
+    "large": {"rows": 10**7, "pngs": 10**5},
+    "xlarge": {"rows": 10**8, "pngs": 10**5},
+}
+
+PAGES = ["Home.py", "pages/1_The_Blueprint.py", "pages/2_First_Cuts.py", "pages/3_Sharper_Views.py"]
+
+# Differences below this are noise whatever the ratio
+NOISE_FLOOR_MS = 5.0
+
+
+def timed(fn, repeat: int = 5) -> dict:
+    """Run `fn` `repeat` times; wall-clock statistics in milliseconds."""
+    times = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1e3)
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(times[0], 3),
+        "p95_ms": round(times[min(len(times) - 1, int(0.95 * len(times)))], 3),
+        "runs": len(times),
+    }
+
+
+def prepare_data(profile: str, out: Path):
+    """(Re)generate the profile's synthetic tree in `out` unless it is already there."""
+    params = PROFILES[profile]
+    marker = out / ".synth.json"
+    if not (marker.exists() and json.loads(marker.read_text()).get("params") == params):
+        from benchmarks import synth
+        shutil.rmtree(out, ignore_errors=True)
+        info = synth.generate(out, params["rows"], params["pngs"])
+        marker.write_text(json.dumps({"params": params, "info": info}))
+
+
+def run_suite(repeat: int, apptest: bool) -> dict:
+    """Every benchmark, keyed by name. Imports happen here, after the env points at the data tree."""
+    from utils import evidence, graph, linkcube, recs, rescoring, snapshots, thumbs, vectors
+    from utils.paths import CACHE_DIR, DATA_DIR, crops_available, graph_crops, manifest, season_examples
+
+    results = {}
+
+    def bench(name, fn, n=repeat):
+        try:
+            results[name] = timed(fn, n)
+        except Exception as e:  # keep going: one broken path should not hide the others
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name:<32} {results[name]}", flush=True)
+
+    # --- Asset discovery
+    mf = manifest()
+    bench("manifest.refresh.cold", lambda: mf.refresh(force=True), 1)
+    bench("manifest.refresh.warm", mf.refresh)
+    bench("assets.crops_available", crops_available)
+    bench("assets.season_examples", season_examples)
+    bench("assets.climate_query", lambda: mf.query("climate", window_no=1))
+
+    # --- Loading
+    files = recs.preset_files(DATA_DIR)
+    src = files["default"]
+    bench("load.parquet_compact", lambda: recs.load_compact(src, "default"), min(repeat, 3))
+    bench("load.snapshot_convert.cold", lambda: snapshots.convert(src), 1)
+    bench("load.snapshot_map", lambda: snapshots.load_frame(snapshots.ensure(src), "default"))
+    df = snapshots.load_frame(snapshots.ensure(src), "default")
+
+    # --- Selectors (on a scratch sidecar: the cold run deletes it, and --data trees are never written)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    sidecar = CACHE_DIR / recs.DICTS_NAME
+    bench("selectors.distinct_values", lambda: recs.distinct_values(src), min(repeat, 3))
+    bench("selectors.sidecar.cold", lambda: (sidecar.unlink(missing_ok=True), recs.preset_dictionary("default", src, sidecar)), 1)
+    bench("selectors.sidecar.warm", lambda: recs.preset_dictionary("default", src, sidecar))
+    choices = recs.preset_dictionary("default", src, sidecar)
+    crop = (choices.get("crop") or [None])[0]
+    region = (choices.get("region_iso") or [None])[0]
+    years = choices.get("year") or []
+
+    # --- Filtering and paging
+    opts = dict(crop=crop, region=region, years=years, min_score=0.0, drop_na=recs.KEY_COLS)
+    bench("filter.pushdown.parquet", lambda: recs.query(src, [c for c in recs.PREFERRED_COLS if c != "__source__"], **opts))
+    snap = snapshots.ensure(src)
+    bench("filter.pushdown.snapshot", lambda: recs.query(snapshots.open_dataset(snap), None, **opts))
+    bench("filter.mask.in_memory", lambda: recs.frame_mask(df, **opts))
+    bench("sort.rank_index.first_page", lambda: recs.RankIndex(df).page("plan_score", False, 0, 100))
+    index = recs.RankIndex(df)
+    index.page("plan_score", False, 0, 100)
+    bench("sort.rank_index.page_50", lambda: index.page("plan_score", False, 50, 100))
+    weights = {f: 0.5 for f in rescoring.FEATURES}
+    bench("rescore.custom_weights", lambda: rescoring.Rescorer(df).score(weights), min(repeat, 3))
+
+    # --- Images
+    images = [DATA_DIR / r["name"] for r in mf.query("climate", window_no=1)[:48]]
+    bench("thumbs.cold_48", lambda: [thumbs.thumbnail(p) for p in images], 1)
+    bench("thumbs.warm_48", lambda: [thumbs.thumbnail(p) for p in images])
+
+    # --- Knowledge graph
+    kg_crops = graph_crops()
+    if kg_crops:
+        kg_crop = kg_crops[0]
+        bench("graph.compile.cold", lambda: graph.load_crop(kg_crop), 1)
+        bench("graph.load.warm", lambda: graph.load_crop(kg_crop))
+        ev = evidence.EvidenceIndex(graph.load_crop(kg_crop))
+        ev_region = evidence.entity_key(ev.g, int(ev.regions[0])) if len(ev.regions) else None
+        ev_year = years[-1] if years else None
+        bench("evidence.retrieve", lambda: ev._retrieve(ev_region, ev_year, None))
+        bench("vectors.build.cold", lambda: vectors.VectorIndex(kg_crops), 1)
+        vindex = vectors.VectorIndex(kg_crops)
+        bench("vectors.search", lambda: vindex.search("flowering stage", k=10))
+        bench("linkcube.ensure.cold", lambda: linkcube.ensure(kg_crops), 1)
+        cube = linkcube.ensure(kg_crops)
+        bench("linkcube.matrix", lambda: linkcube.matrix(cube, "region_iso", "month"))
+
+    # --- Full script runs (first run is cold: empty Streamlit caches)
+    if apptest:
+        from streamlit.testing.v1 import AppTest
+
+        for script in PAGES:
+            def page_run(script=script):
+                at = AppTest.from_file(str(ROOT / script), default_timeout=600).run()
+                if at.exception:
+                    raise RuntimeError(at.exception[0].value)
+            name = f"page.{Path(script).stem}"
+            bench(f"{name}.cold", page_run, 1)
+            bench(f"{name}.warm", page_run)
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Names of benchmarks whose median regressed beyond `tolerance` x baseline."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = current["results"].get(name)
+        if "median_ms" not in base:
+            continue
+        if not cur or "median_ms" not in cur:
+            # A benchmark that crashes or disappeared is a regression, not a skip
+            print(f"{'REGRESSION':<11}{name:<32} {(cur or {}).get('error', 'missing from this run')}")
+            regressions.append(name)
+            continue
+        ratio = cur["median_ms"] / max(base["median_ms"], 1e-9)
+        slower = cur["median_ms"] - base["median_ms"]
+        flag = ratio > tolerance and slower > NOISE_FLOOR_MS
+        print(f"{'REGRESSION' if flag else 'ok':<11}{name:<32} {base['median_ms']:>10.1f} -> "
+              f"{cur['median_ms']:>10.1f} ms  (x{ratio:.2f})")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app on synthetic data.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--data", type=Path, help="benchmark an existing crop_app_data tree instead")
+    parser.add_argument("--work", type=Path, default=Path(os.environ.get("TMPDIR", "/tmp")) / "euroagri-bench",
+                        help="where synthetic trees and caches live")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-apptest", action="store_true", help="skip the full page runs")
+    parser.add_argument("--out", type=Path, help="write results JSON here")
+    parser.add_argument("--save", action="store_true", help="store results as the profile's baseline")
+    parser.add_argument("--compare", nargs="?", const="auto", help="baseline JSON to compare against "
+                        "(default: the profile's stored baseline)")
+    parser.add_argument("--tolerance", type=float, default=1.3, help="allowed slowdown ratio")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data or args.work / args.profile
+    cache_dir = args.work / f"{args.profile}-cache"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # utils.paths reads these at import time, so set them before anything (synth included) imports it
+    os.environ["EUROAGRI_DATA_DIR"] = str(data_dir)
+    os.environ["EUROAGRI_CACHE_DIR"] = str(cache_dir)
+    os.environ["EUROAGRI_PACK"] = str(args.work / f"{args.profile}.eapack")
+    sys.path.insert(0, str(ROOT))
+    if args.data is None:
+        prepare_data(args.profile, data_dir)
+
+    results = {
+        "meta": {
+            "profile": args.profile,
+            "data_dir": str(data_dir),
+            **({} if args.data else PROFILES[args.profile]),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": run_suite(args.repeat, apptest=not args.no_apptest),
+    }
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        (BASELINE_DIR / f"{args.profile}.json").write_text(json.dumps(results, indent=2))
+    if args.compare:
+        path = BASELINE_DIR / f"{args.profile}.json" if args.compare == "auto" else Path(args.compare)
+        if not path.exists():
+            print(f"No baseline at {path}; run with --save first.")
+            return 0
+        regressions = compare(results, json.loads(path.read_text()), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
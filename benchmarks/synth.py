@@ -0,0 +1,202 @@
+# benchmarks/synth.py
+"""
+Synthetic crop_app_data trees for benchmarking.
+
+Writes, into one directory that EUROAGRI_DATA_DIR can point at:
+
+* every preset parquet of utils.recs.PRESETS with `rows` rows each, written
+  in row groups so 1e8 rows never sit in memory at once,
+  plus recommendations_meta.json;
+* `pngs` snapshot images following the pipeline's names
+  (subgraph_crop_*, subgraph_season_{region}_2024_{crop},
+  subgraph_climate_{region}_{year}_{n}, schema_metagraph);
+* optionally a small graph_crop_{crop}.graphml per crop with the typed
+  Region / ClimateWindow / StageWindow / Plan / Variety topology.
+
+    python -m benchmarks.synth --out /tmp/eabench --rows 1e6 --pngs 1e4
+"""
+import argparse
+import io
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+
+from utils.recs import PRESETS
+
+CROPS = ["barley", "beans", "maize", "peas", "potato", "rapeseed", "sugarbeet", "wheat"]
+COUNTRIES = ["BE", "DE", "FR", "NL", "PL", "ES", "IT", "DK"]
+YEARS = list(range(2015, 2025))
+STAGES = ["emergence", "vegetative", "reproductive", "maturity"]
+ROW_GROUP = 1_000_000
+
+
+def regions(n: int) -> list:
+    """NUTS-like codes, e.g. BE-BE21."""
+    return [f"{COUNTRIES[i % len(COUNTRIES)]}-{COUNTRIES[i % len(COUNTRIES)]}{i // len(COUNTRIES) + 10}"
+            for i in range(n)]
+
+
+def _chunk(rng, n: int, region_codes: list, varieties: int) -> pa.Table:
+    crop = rng.integers(0, len(CROPS), n)
+    score = rng.beta(4, 2, n).astype(np.float32)
+    cols = {
+        "region_iso": pa.DictionaryArray.from_arrays(pa.array(rng.integers(0, len(region_codes), n), pa.int32()),
+                                                     pa.array(region_codes)),
+        "crop": pa.DictionaryArray.from_arrays(pa.array(crop.astype(np.int32)), pa.array(CROPS)),
+        "variety": pa.DictionaryArray.from_arrays(
+            pa.array((crop * varieties + rng.integers(0, varieties, n)).astype(np.int32)),
+            pa.array([f"{c}{v}" for c in CROPS for v in range(varieties)])),
+        "year": pa.array(rng.choice(YEARS, n).astype(np.int16)),
+        "plan_score": pa.array(np.where(rng.random(n) < 0.02, np.nan, score)),
+        "variety_fit": pa.array(rng.random(n).astype(np.float32)),
+        "disease_fit": pa.array(np.where(rng.random(n) < 0.05, np.nan, rng.random(n)).astype(np.float32)),
+        "irr_total_mm": pa.array(rng.gamma(2.0, 60.0, n).astype(np.float32)),
+        "etc_total_mm": pa.array(rng.normal(450, 80, n).astype(np.float32)),
+        "pe_total_mm": pa.array(rng.normal(300, 90, n).astype(np.float32)),
+        "rainfall_share": pa.array(rng.random(n).astype(np.float32)),
+        "n_kg_ha": pa.array(rng.normal(150, 40, n).astype(np.float32)),
+        "p_kg_ha": pa.array(rng.normal(60, 15, n).astype(np.float32)),
+        "k_kg_ha": pa.array(rng.normal(90, 25, n).astype(np.float32)),
+        "net_irrig_mm_sel": pa.array(rng.gamma(2.0, 40.0, n).astype(np.float32)),
+        "robust_score": pa.array((score * rng.uniform(0.8, 1.0, n)).astype(np.float32)),
+        "rank_plan": pa.array(rng.integers(1, 50, n).astype(np.int32)),
+    }
+    return pa.table(cols)
+
+
+def write_presets(out: Path, rows: int, n_regions: int = 300, varieties: int = 40, seed: int = 0) -> list:
+    """One parquet per preset with `rows` rows each; returns the written paths."""
+    region_codes = regions(n_regions)
+    written = []
+    for k, (preset, name) in enumerate(PRESETS.items()):
+        rng = np.random.default_rng(seed + k)
+        path = out / name
+        writer = None
+        try:
+            left = rows
+            while left > 0:
+                table = _chunk(rng, min(ROW_GROUP, left), region_codes, varieties)
+                writer = writer or pq.ParquetWriter(str(path), table.schema)
+                writer.write_table(table, row_group_size=ROW_GROUP)
+                left -= table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        written.append(path)
+    (out / "recommendations_meta.json").write_text(json.dumps(
+        {"generator": "benchmarks.synth", "rows_per_preset": rows, "presets": list(PRESETS)}, indent=2))
+    return written
+
+
+def png_names(n: int, n_regions: int = 300) -> list:
+    """`n` file names following the pipeline's snapshot naming patterns."""
+    names = ["schema_metagraph.png"]
+    for crop in CROPS:
+        names += [f"subgraph_crop_{crop}{suffix}.png"
+                  for suffix in ("", "_matrix", "_climate", "_climate_matrix", "_disease", "_disease_matrix")]
+    region_codes = regions(n_regions)
+    names += [f"subgraph_season_{r}_2024_{c}.png" for r in region_codes[:24] for c in CROPS]
+    i = 0
+    while len(names) < n:
+        r = region_codes[i % len(region_codes)]
+        y = YEARS[(i // len(region_codes)) % len(YEARS)]
+        w = i // (len(region_codes) * len(YEARS)) + 1
+        names.append(f"subgraph_climate_{r}_{y}_{w}.png")
+        i += 1
+    return names[:n]
+
+
+def write_pngs(out: Path, n: int, size: int = 800, n_regions: int = 300) -> int:
+    """
+    Write `n` snapshot PNGs. All share the same bytes (a `size`-px, mostly white
+    image with sparse coloured marks, like the real exports), so generation is I/O bound.
+    """
+    rng = np.random.default_rng(1)
+    pixels = np.full((size, size, 3), 255, dtype=np.uint8)
+    marks = rng.random((size, size)) < 0.03
+    pixels[marks] = rng.integers(0, 255, (int(marks.sum()), 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    data = buf.getvalue()
+    names = png_names(n, n_regions)
+    for name in names:
+        (out / name).write_bytes(data)
+    return len(names)
+
+
+def write_graphs(out: Path, n_regions: int = 60, windows: int = 4, plans: int = 6) -> int:
+    """A graph_crop_{crop}.graphml per crop with the typed topology the pages traverse."""
+    region_codes = regions(n_regions)
+    for crop in CROPS:
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">',
+            '<key id="t" for="node" attr.name="node_type" attr.type="string"/>',
+            '<key id="y" for="node" attr.name="year" attr.type="int"/>',
+            '<key id="m" for="node" attr.name="month" attr.type="int"/>',
+            '<key id="s" for="node" attr.name="stage" attr.type="string"/>',
+            '<key id="r" for="edge" attr.name="rel" attr.type="string"/>',
+            '<graph edgedefault="directed">',
+        ]
+
+        def node(nid, t, **attrs):
+            data = "".join(f'<data key="{k}">{v}</data>' for k, v in attrs.items())
+            lines.append(f'<node id="{nid}"><data key="t">{t}</data>{data}</node>')
+
+        def edge(s, t, rel):
+            lines.append(f'<edge source="{s}" target="{t}"><data key="r">{rel}</data></edge>')
+
+        for v in range(plans):
+            node(f"Variety:{crop}{v}", "Variety")
+        for stage in STAGES:
+            for y in YEARS:
+                node(f"StageWindow:{crop}_{stage}_{y}", "StageWindow", y=y, s=stage)
+        for r in region_codes:
+            node(f"Region:{r}", "Region")
+            for y in YEARS:
+                for w in range(1, windows + 1):
+                    cw = f"ClimateWindow:{r}_{y}_{w}"
+                    node(cw, "ClimateWindow", y=y, m=3 * w)
+                    edge(f"Region:{r}", cw, "REGION_HAS_CLIMATE")
+                    for stage in STAGES[:w]:
+                        edge(cw, f"StageWindow:{crop}_{stage}_{y}", "CLIMATE_SUPPORTS_STAGE")
+                for p in range(plans):
+                    pl = f"Plan:{crop}_{r}_{y}_{p}"
+                    node(pl, "Plan", y=y)
+                    edge(pl, f"Region:{r}", "PLAN_APPLIES_TO")
+                    edge(pl, f"Variety:{crop}{p}", "PLAN_USES_VARIETY")
+        lines += ["</graph>", "</graphml>"]
+        (out / f"graph_crop_{crop}.graphml").write_text("\n".join(lines))
+    return len(CROPS)
+
+
+def generate(out: Path, rows: int, pngs: int, graphs: bool = True, png_size: int = 800) -> dict:
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    write_presets(out, rows)
+    n_png = write_pngs(out, pngs, png_size)
+    n_graph = write_graphs(out) if graphs else 0
+    # Bump the directory mtime so manifests built against an older tree refresh
+    os.utime(out)
+    return {"rows_per_preset": rows, "pngs": n_png, "graphs": n_graph}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic crop_app_data tree.")
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--rows", type=float, default=1e5, help="rows per preset parquet (1e5 .. 1e8)")
+    parser.add_argument("--pngs", type=float, default=1e3, help="snapshot images (1e3 .. 1e5)")
+    parser.add_argument("--png-size", type=int, default=800, help="edge length of the PNGs in px")
+    parser.add_argument("--no-graphs", action="store_true", help="skip the GraphML exports")
+    args = parser.parse_args(argv)
+    info = generate(args.out, int(args.rows), int(args.pngs), graphs=not args.no_graphs, png_size=args.png_size)
+    print(json.dumps(info))
+
+
+if __name__ == "__main__":
+    main()
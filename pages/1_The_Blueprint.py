@@ -1,12 +1,12 @@
 # 1_The_Blueprint.py
-from pathlib import Path
 import streamlit as st
 
-# If you created utils/paths.py earlier, prefer importing the base dir:
-#   from utils.paths import CROP_APP_DATA
-# and set BASE = CROP_APP_DATA
-# For this page we'll point directly to the WSL path you provided.
-BASE = Path("/mnt/d/Colab/Ecosystem/Deep RL and LLM/Agri/data/processed/kg/crop_app_data")
+from utils import metrics
+from utils.paths import DATA_DIR, asset_exists, data_source
+from utils.gallery import show_image
+
+BASE = DATA_DIR
+metrics.start_exporter()
 
 st.title("The Blueprint")
 
@@ -49,23 +49,23 @@ for crop in CROPS:
         cols = st.columns(3, gap="large")
 
         # Overview
-        if p_overview.exists():
-            cols[0].image(str(p_overview), caption=p_overview.name, use_container_width=True)
+        if asset_exists(p_overview):
+            show_image(cols[0], p_overview, caption=p_overview.name)
         else:
             cols[0].warning(f"Missing: {p_overview}")
 
         # Region Matrix
-        if p_matrix.exists():
-            cols[1].image(str(p_matrix), caption=p_matrix.name, use_container_width=True)
+        if asset_exists(p_matrix):
+            show_image(cols[1], p_matrix, caption=p_matrix.name)
         else:
             cols[1].warning(f"Missing: {p_matrix}")
 
         # Climate Matrix
-        if p_climate.exists():
-            cols[2].image(str(p_climate), caption=p_climate.name, use_container_width=True)
+        if asset_exists(p_climate):
+            show_image(cols[2], p_climate, caption=p_climate.name)
         else:
             cols[2].warning(f"Missing: {p_climate}")
 
 st.markdown("---")
-st.info("Images are read from the WSL path: "
-        f"`{BASE}`")
\ No newline at end of file
+st.info("Images are read from: "
+        f"`{data_source().describe()}`")
\ No newline at end of file
@@ -3,9 +3,13 @@ from pathlib import Path
 import streamlit as st
 
 # Use the shared paths module from utils/
-from utils.paths import KG_APP_DIR
+from utils import metrics
+from utils.paths import KG_APP_DIR, asset_exists, asset_stat, graph_crops, graphml
+from utils.gallery import prepare, show_image
+from utils.subgraph import evidence_index, figure, graph_choices, season_subgraph
 
 st.set_page_config(page_title="Season Snapshots", layout="wide")
+metrics.start_exporter()
 
 st.title("🗺️ Season Snapshots")
 
@@ -38,14 +42,15 @@ def season_png(region: str, crop: str) -> Path:
     return KG_APP_DIR / f"subgraph_season_{region}_2024_{crop}.png"
 
 def show_region_grid(region: str, crops=SEASON_CROPS, cols_per_row: int = 4):
-    st.subheader(f"Region: {region}")
+    # Decode/resize every existing image of the region concurrently, then lay out the grid
+    ready = prepare([p for p in (season_png(region, c) for c in crops) if asset_exists(p)])
     rows = [crops[i:i+cols_per_row] for i in range(0, len(crops), cols_per_row)]
     for row in rows:
         cols = st.columns(len(row))
         for c, col in zip(row, cols):
             p = season_png(region, c)
-            if p.exists():
-                col.image(str(p), caption=p.name, use_container_width=True)
+            if p in ready:
+                show_image(col, p, caption=p.name, thumb=ready[p])
             else:
                 col.warning(f"Missing: {p.name}")
 
@@ -53,14 +58,50 @@ def show_region_grid(region: str, crops=SEASON_CROPS, cols_per_row: int = 4):
 # Content
 # ---------------------------------------------------------------------------
 
-# Region BE-BE10
-show_region_grid("BE-BE10")
+# Pre-rendered examples exported by the pipeline (2024 only)
+SEASON_REGIONS = ["BE-BE10", "BE-BE21", "BE-BE22"]
 
-# Region BE-BE21
-show_region_grid("BE-BE21")
+def show_png_gallery(open_first: bool):
+    # Only opened regions are decoded and sent
+    for i, region in enumerate(SEASON_REGIONS):
+        if st.toggle(f"Region: {region}", value=open_first and i == 0, key=f"season_region_{region}"):
+            show_region_grid(region)
 
-# Region BE-BE22
-show_region_grid("BE-BE22")
+GRAPH_CROPS = graph_crops()
+
+if GRAPH_CROPS:
+    # Any (crop, region, year) in the graph exports is cut out and laid out on demand
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        crop = st.selectbox("Crop", GRAPH_CROPS, index=GRAPH_CROPS.index("wheat") if "wheat" in GRAPH_CROPS else 0)
+    stamp = asset_stat(graphml(crop))
+    try:
+        index = evidence_index(crop, stamp)
+        regions, years = graph_choices(crop, stamp)
+    except ValueError as e:
+        # Unreadable GraphML export: keep the page (and the PNG gallery) usable
+        st.warning(str(e))
+        index, regions, years = None, [], []
+    with c2:
+        region = st.selectbox("Region", regions, index=0 if regions else None)
+    with c3:
+        year = st.selectbox("Year", years, index=len(years) - 1 if years else None)
+
+    pack = index.pack(region, year) if index is not None and region else None
+    nodes, edges = season_subgraph(pack) if pack is not None else (None, None)
+    if nodes is None or nodes.empty:
+        st.info("No season subgraph for this selection in the knowledge graph.")
+    else:
+        st.plotly_chart(figure(nodes, edges, title=f"Season subgraph · {region} · {year} · {crop}"),
+                        use_container_width=True)
+        note = " Dense neighbourhoods were capped." if pack.truncated else ""
+        st.caption(f"{len(nodes)} nodes, {len(edges)} edges.{note} Hover a node for its attributes; "
+                   "click legend entries to hide node or edge types.")
+
+    st.markdown("#### Pre-rendered snapshots")
+    show_png_gallery(open_first=False)
+else:
+    show_png_gallery(open_first=True)
 
 with st.expander("What you're seeing in the subgraph_season_{region}_{year}_{crop name}.png examples?"):
     st.markdown(
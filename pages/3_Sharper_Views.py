@@ -1,9 +1,15 @@
 # pages/3_Sharper_Views.py
 from pathlib import Path
+import pandas as pd
+import plotly.express as px
 import streamlit as st
-from utils.paths import KG_APP_DIR
+from utils import linkcube, metrics
+from utils.paths import KG_APP_DIR, asset_stat, data_source, graph_crops, graphml, manifest
+from utils.gallery import prefetch, prepare, show_image
+from utils.subgraph import climate_subgraph, climate_windows, evidence_index, figure, graph_choices
 
 st.set_page_config(page_title="Sharper Views — Climate Snapshots", layout="wide")
+metrics.start_exporter()
 
 # ---------------------------------------------------------------------
 # Title & short intro
@@ -38,21 +44,117 @@ Use this gallery to quickly compare seasonal climate–stage link density across
 # Example: subgraph_climate_BE-BE21_2019_1.png
 # ---------------------------------------------------------------------
 def list_climate_images():
-    files = sorted(KG_APP_DIR.glob("subgraph_climate_*_*_1.png"))
     items = []
-    for p in files:
-        # name like: subgraph_climate_BE-BE21_2019_1.png
-        stem = p.stem  # "subgraph_climate_BE-BE21_2019_1"
-        parts = stem.split("_")
-        if len(parts) < 5:
-            continue
-        region = parts[2]          # e.g., "BE-BE21"
-        year = parts[3]            # e.g., "2019"
-        country = region.split("-")[0] if "-" in region else "??"
-        items.append({"path": p, "country": country, "region": region, "year": year})
+    for r in manifest().query("climate", window_no=1):
+        # name like: subgraph_climate_BE-BE21_2019_1.png (parsed once by the manifest)
+        items.append({
+            "path": KG_APP_DIR / r["name"],
+            "country": r["country"],
+            "region": r["region"],
+            "year": str(r["year"]),
+        })
     return items
 
 ALL = list_climate_images()
+GRAPH_CROPS = graph_crops()
+
+# ---------------------------------------------------------------------
+# Link-density analytics: heatmap and ranking from the precomputed cube;
+# the image gallery below is the drill-down
+# ---------------------------------------------------------------------
+@metrics.cache_data(show_spinner="Counting climate → stage links…", max_entries=4)
+def load_cube(stamps: tuple) -> pd.DataFrame:
+    """Link-density cube for the crops in `stamps` ((crop, stat) pairs key re-exports)."""
+    return linkcube.ensure([crop for crop, _ in stamps])
+
+if GRAPH_CROPS:
+    st.subheader("Climate → stage link density")
+    try:
+        cube = load_cube(tuple((c, asset_stat(graphml(c))) for c in GRAPH_CROPS))
+    except ValueError as e:
+        st.warning(str(e))
+        cube = None
+    if cube is not None and cube.empty:
+        st.info("The graph exports contain no CLIMATE_SUPPORTS_STAGE edges.")
+    elif cube is not None:
+        d1, d2, d3, d4, d5 = st.columns(5)
+        with d1:
+            cube_crops = st.multiselect("Crops", sorted(cube["crop"].unique()), default=sorted(cube["crop"].unique()))
+        with d2:
+            cube_countries = st.multiselect("Countries", sorted(cube["country"].unique()))
+        with d3:
+            cube_years = st.multiselect("Years", sorted(cube["year"].unique()))
+        with d4:
+            rows_dim = st.selectbox("Heatmap rows", ["region_iso", "country", "stage", "year"], index=0)
+        with d5:
+            cols_dim = st.selectbox("Heatmap columns", [d for d in ["month", "year", "stage", "region_iso", "country"]
+                                                        if d != rows_dim], index=0)
+        filters = dict(crop=cube_crops, country=cube_countries, year=cube_years)
+
+        mat = linkcube.matrix(cube, rows_dim, cols_dim, **filters)
+        if mat.empty:
+            st.info("No links in this slice.")
+        else:
+            # Keep the heatmap readable: the 40 densest rows
+            if len(mat) > 40:
+                mat = mat.loc[mat.sum(axis=1).nlargest(40).index]
+            mat.index, mat.columns = mat.index.astype(str), mat.columns.astype(str)
+            fig = px.imshow(mat, aspect="auto", color_continuous_scale="Blues",
+                            labels=dict(x=cols_dim, y=rows_dim, color="links"))
+            fig.update_layout(height=max(320, 22 * len(mat) + 120), margin=dict(l=10, r=10, t=10, b=10))
+            st.plotly_chart(fig, use_container_width=True)
+
+            rank = linkcube.ranking(cube, "region_iso", n=20, **filters)
+            st.markdown("**Densest regions**")
+            st.dataframe(rank, hide_index=True, use_container_width=True,
+                         column_config={"share": st.column_config.ProgressColumn("share", min_value=0.0, max_value=1.0)})
+            r1, r2 = st.columns([2, 1])
+            with r1:
+                drill = st.selectbox("Drill down into", rank["region_iso"].astype(str).tolist())
+            with r2:
+                st.write("")
+                if st.button("Show its snapshots below"):
+                    if drill in {x["region"] for x in ALL}:
+                        st.session_state["gallery_regions"] = [drill]
+                    else:
+                        st.info(f"No pre-rendered snapshots for {drill}; use the interactive view below.")
+    st.markdown("---")
+
+# ---------------------------------------------------------------------
+# Interactive view: any region, year and climate window in the graph exports,
+# not only the first window the pipeline pre-rendered
+# ---------------------------------------------------------------------
+if GRAPH_CROPS:
+    st.subheader("Interactive climate subgraph")
+    g1, g2, g3, g4 = st.columns([1, 1, 1, 2])
+    with g1:
+        crop = st.selectbox("Crop", GRAPH_CROPS, index=GRAPH_CROPS.index("wheat") if "wheat" in GRAPH_CROPS else 0)
+    stamp = asset_stat(graphml(crop))
+    try:
+        index = evidence_index(crop, stamp)
+        graph_regions, graph_years = graph_choices(crop, stamp)
+    except ValueError as e:
+        # Unreadable GraphML export: keep the page (and the PNG gallery) usable
+        st.warning(str(e))
+        index, graph_regions, graph_years = None, [], []
+    with g2:
+        region = st.selectbox("Region", graph_regions, index=0 if graph_regions else None, key="kg_region")
+    with g3:
+        year = st.selectbox("Year", graph_years, index=len(graph_years) - 1 if graph_years else None, key="kg_year")
+
+    pack = index.pack(region, year) if index is not None and region else None
+    windows = climate_windows(pack) if pack is not None else []
+    with g4:
+        window = st.selectbox("Climate window", windows, index=0 if windows else None)
+    if window:
+        nodes, edges = climate_subgraph(pack, window)
+        st.plotly_chart(figure(nodes, edges, title=f"{window} · {region} · {year}"), use_container_width=True)
+        st.caption(f"{int((nodes['section'] == 'stage').sum())} supported stage window(s). Dotted edges are CLIMATE_SUPPORTS_STAGE.")
+    else:
+        st.info("No climate windows for this selection in the knowledge graph.")
+    st.markdown("---")
+    st.subheader("Pre-rendered snapshots")
+
 if not ALL:
     st.warning("No climate images found in: {}".format(KG_APP_DIR))
     st.stop()
@@ -68,8 +170,10 @@ with st.sidebar:
     filtered = [x for x in ALL if x["country"] in sel_countries] if sel_countries else ALL
 
     regions = sorted({x["region"] for x in filtered})
-    # If there are many, preselect none to encourage scoping
-    sel_regions = st.multiselect("Region", regions, default=[])
+    # If there are many, preselect none to encourage scoping (drill-downs above preselect one)
+    kept = [r for r in st.session_state.get("gallery_regions", []) if r in regions]
+    st.session_state["gallery_regions"] = kept
+    sel_regions = st.multiselect("Region", regions, key="gallery_regions")
 
     if sel_regions:
         filtered = [x for x in filtered if x["region"] in sel_regions]
@@ -105,23 +209,28 @@ st.write(f"Showing **{len(page_items)}** of **{total}** images  •  Page {page_
 # Grid renderer
 # ---------------------------------------------------------------------
 def show_grid(items, ncols: int):
+    # Thumbnails for the whole group are produced concurrently before layout
+    ready = prepare([cell["path"] for cell in items])
     rows = [items[i:i+ncols] for i in range(0, len(items), ncols)]
     for row in rows:
         cols = st.columns(len(row))
         for cell, col in zip(row, cols):
             cap = f"{cell['path'].name}  \n{cell['region']} • {cell['year']}"
-            col.image(str(cell["path"]), caption=cap, use_container_width=True)
+            show_image(col, cell["path"], caption=cap, thumb=ready[cell["path"]])
 
-# Group by Country to avoid visual overload
+# Group by Country to avoid visual overload; a country's images are only decoded once opened
 for c in sorted({x["country"] for x in page_items}):
     sub = [x for x in page_items if x["country"] == c]
     if not sub:
         continue
-    with st.expander(f"Country: {c}  — {len(sub)} image(s)", expanded=True if len(page_items) <= 12 else False):
+    if st.toggle(f"Country: {c}  — {len(sub)} image(s)", value=len(page_items) <= 12, key=f"country_{c}"):
         show_grid(sub, ncols=ncols)
 
+# Warm the next page in the background once this one is on screen
+prefetch([x["path"] for x in filtered[end:end + page_size]])
+
 st.markdown("---")
-st.caption(f"Source: {KG_APP_DIR}")
+st.caption(f"Source: {data_source().describe()}")
 
 with st.expander("What you're seeing in the subgraph_climate_{region}_{year}_1.png examples?"):
     st.markdown(
@@ -0,0 +1,36 @@
+# tests/test_evidence.py
+import io
+
+from utils import evidence
+from utils.graph import CropGraph, compile_graph
+
+GRAPHML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns">
+  <key id="rel" for="edge" attr.name="rel" attr.type="string"/>
+  <graph edgedefault="directed">
+    <node id="Region:BE22"/>
+    <node id="ClimateWindow:BE22_2024_5"/>
+    <node id="CropStage:flowering"/>
+    <node id="DiseaseStageRisk:septoria_flowering"/>
+    <edge source="Region:BE22" target="ClimateWindow:BE22_2024_5"><data key="rel">REGION_HAS_CLIMATE</data></edge>
+    <edge source="ClimateWindow:BE22_2024_5" target="CropStage:flowering"><data key="rel">CLIMATE_SUPPORTS_STAGE</data></edge>
+    <edge source="CropStage:flowering" target="DiseaseStageRisk:septoria_flowering"><data key="rel">STAGE_HAS_RISK</data></edge>
+  </graph>
+</graphml>
+"""
+
+
+def test_section_of_prefers_specific_sections():
+    assert evidence.section_of("DiseaseStageRisk") == "disease"
+    assert evidence.section_of("WaterDeficit") == "water"
+    assert evidence.section_of("CropStage") == "stage"
+
+
+def test_disease_stage_risk_lands_in_disease_section():
+    g = CropGraph(*compile_graph(io.BytesIO(GRAPHML)))
+    pack = evidence.EvidenceIndex(g).pack("BE22")
+
+    assert pack.found
+    assert pack.section("disease")["id"].tolist() == ["DiseaseStageRisk:septoria_flowering"]
+    assert pack.section("stage")["id"].tolist() == ["CropStage:flowering"]
+    assert pack.counts.get("disease") == 1
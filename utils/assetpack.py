@@ -0,0 +1,115 @@
+# utils/assetpack.py
+"""
+Single-file asset pack for the crop_app_data directory.
+
+Layout (little endian):
+
+    b"EAPACK01" | u64 index_offset | u64 index_length | blobs ... | index (JSON)
+
+Blobs are the raw file contents, each starting on a 64-byte boundary so
+Arrow/parquet readers can use them in place. The index maps every file name
+to [offset, length, mtime_ns]. Readers memory-map the pack once and hand out
+zero-copy memoryviews, so opening an asset never touches the slow mount
+again.
+
+    python -m utils.assetpack build                 # DATA_DIR -> PACK_PATH
+    python -m utils.assetpack build --src DIR --out crop_app_data.eapack
+    python -m utils.assetpack list
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+MAGIC = b"EAPACK01"
+HEADER = struct.Struct("<8sQQ")
+ALIGN = 64
+
+
+def build(src_dir: Path, out_path: Path, skip=(".tmp",)) -> int:
+    """Pack every regular file directly under `src_dir`; returns the number of files."""
+    src_dir, out_path = Path(src_dir), Path(out_path)
+    entries = sorted((e for e in os.scandir(src_dir) if e.is_file() and not e.name.endswith(skip)),
+                     key=lambda e: e.name)
+    index = {}
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, 0, 0))
+        for e in entries:
+            pad = -out.tell() % ALIGN
+            out.write(b"\0" * pad)
+            offset = out.tell()
+            with open(e.path, "rb") as fh:
+                while chunk := fh.read(1 << 20):
+                    out.write(chunk)
+            index[e.name] = [offset, out.tell() - offset, e.stat().st_mtime_ns]
+        raw = json.dumps(index, separators=(",", ":")).encode()
+        index_offset = out.tell()
+        out.write(raw)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, index_offset, len(raw)))
+    os.replace(tmp, out_path)
+    return len(index)
+
+
+class AssetPack:
+    """Read-only, memory-mapped view of a pack file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not an asset pack: {self.path}")
+        self.index = json.loads(self._mmap[index_offset:index_offset + index_length])
+        st = self.path.stat()
+        self.stamp = f"{st.st_mtime_ns}-{st.st_size}"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def names(self) -> list:
+        return list(self.index)
+
+    def stat(self, name: str):
+        """(size, mtime_ns) of a packed file."""
+        _, length, mtime_ns = self.index[name]
+        return length, mtime_ns
+
+    def view(self, name: str) -> memoryview:
+        """Zero-copy view of a packed file's bytes (valid while the pack is open)."""
+        offset, length, _ = self.index[name]
+        return memoryview(self._mmap)[offset:offset + length]
+
+    def read(self, name: str) -> bytes:
+        return bytes(self.view(name))
+
+
+def main(argv=None):
+    # Imported here: utils.paths itself builds on this module through utils.datasource
+    from utils.paths import DATA_DIR, PACK_PATH
+
+    parser = argparse.ArgumentParser(description="Pack crop_app_data into a single indexed file.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="pack a directory")
+    b.add_argument("--src", type=Path, default=DATA_DIR)
+    b.add_argument("--out", type=Path, default=PACK_PATH)
+    ls = sub.add_parser("list", help="list the files in a pack")
+    ls.add_argument("--pack", type=Path, default=PACK_PATH)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        n = build(args.src, args.out)
+        print(f"Packed {n} files into {args.out}")
+    else:
+        pack = AssetPack(args.pack)
+        for name in sorted(pack.names()):
+            size, _ = pack.stat(name)
+            print(f"{size:>12}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# utils/compare.py
+"""
+Cross-preset comparison: how the same (region, crop, variety, year) plan
+ranks and scores under each objective preset.
+
+All presets are aligned in a single hash aggregation over the stacked table
+from load_all() and unstacked side by side, instead of filtering each preset
+separately and merging pairwise.
+"""
+import numpy as np
+import pandas as pd
+
+KEY_COLS = ["region_iso", "crop", "variety", "year"]
+
+# Metric -> how duplicate rows of one key within a preset are reduced
+METRICS = {"plan_score": "max", "robust_score": "max", "rank_plan": "min"}
+
+
+def compare_presets(stacked: pd.DataFrame, presets: list, baseline: str | None = None) -> pd.DataFrame:
+    """
+    One row per key with `<metric>_<preset>` columns, plus
+
+    - `rank_delta_<preset>`: rank_plan change against `baseline` (negative = better),
+    - `plan_score_spread`: max - min plan_score across presets,
+    - `best_preset`: the preset giving the highest plan_score.
+
+    `stacked` is the concatenation of the presets with their `__source__` tag.
+    """
+    if stacked.empty or "__source__" not in stacked:
+        return pd.DataFrame()
+    keys = [c for c in KEY_COLS if c in stacked.columns]
+    metrics = {m: how for m, how in METRICS.items() if m in stacked.columns}
+    if not keys or not metrics:
+        return pd.DataFrame()
+
+    grouped = stacked.groupby(keys + ["__source__"], observed=True, sort=False, dropna=False)
+    wide = grouped.agg(metrics).unstack("__source__")
+    presets = [p for p in presets if p in wide.columns.get_level_values(1)]
+    out = pd.DataFrame(index=wide.index)
+    for m in metrics:
+        for p in presets:
+            out[f"{m}_{p}"] = wide[(m, p)].astype(np.float32)
+
+    baseline = baseline if baseline in presets else (presets[0] if presets else None)
+    if "rank_plan" in metrics and baseline:
+        for p in presets:
+            if p != baseline:
+                out[f"rank_delta_{p}"] = out[f"rank_plan_{p}"] - out[f"rank_plan_{baseline}"]
+    if "plan_score" in metrics and presets:
+        scores = out[[f"plan_score_{p}" for p in presets]]
+        out["plan_score_spread"] = (scores.max(axis=1) - scores.min(axis=1)).astype(np.float32)
+        best = scores.to_numpy(dtype=np.float32, na_value=-np.inf).argmax(axis=1)
+        out["best_preset"] = pd.Categorical.from_codes(best.astype(np.int8), categories=presets)
+        out.loc[scores.isna().all(axis=1).to_numpy(), "best_preset"] = np.nan
+    return out.reset_index()
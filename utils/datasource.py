@@ -0,0 +1,111 @@
+# utils/datasource.py
+"""
+Where asset bytes come from: a loose directory or a packed bundle.
+
+Both sources answer the same questions by file name, so pages, the manifest,
+thumbnails and the recommendation readers never care which one is active.
+utils.paths picks the source once per process (the pack wins if it exists).
+"""
+import io
+import os
+from pathlib import Path
+
+from utils.assetpack import AssetPack
+
+
+class DirSource:
+    """Files under a directory (the pipeline's crop_app_data output)."""
+
+    kind = "directory"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def describe(self) -> str:
+        return str(self.root)
+
+    def stamp(self) -> str | None:
+        """Changes whenever files are added, removed or renamed."""
+        try:
+            return str(self.root.stat().st_mtime_ns)
+        except OSError:
+            return None
+
+    def listing(self) -> dict:
+        """{name: change token}; tokens are inodes, which change when a file is replaced."""
+        with os.scandir(self.root) as it:
+            return {e.name: str(e.inode()) for e in it if e.is_file()}
+
+    def stat(self, name: str):
+        st = (self.root / name).stat()
+        return st.st_size, st.st_mtime_ns
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).is_file()
+
+    def open(self, name: str):
+        return open(self.root / name, "rb")
+
+    def read(self, name: str) -> bytes:
+        return (self.root / name).read_bytes()
+
+    def image_input(self, name: str):
+        """What to hand to st.image (a path lets Streamlit serve the file directly)."""
+        return str(self.root / name)
+
+    def arrow_input(self, name: str):
+        """What to hand to pyarrow readers."""
+        return str(self.root / name)
+
+    def watch_path(self, name: str) -> Path:
+        """The file whose fingerprint tracks changes to `name`."""
+        return self.root / name
+
+
+class PackSource:
+    """Files inside a memory-mapped asset pack (utils/assetpack.py)."""
+
+    kind = "pack"
+
+    def __init__(self, pack_path: Path):
+        self.pack = AssetPack(pack_path)
+
+    def describe(self) -> str:
+        return f"{self.pack.path} (asset pack, {len(self.pack.index)} files)"
+
+    def stamp(self) -> str | None:
+        return self.pack.stamp
+
+    def listing(self) -> dict:
+        return {name: f"{off}-{mtime}" for name, (off, _, mtime) in self.pack.index.items()}
+
+    def stat(self, name: str):
+        return self.pack.stat(name)
+
+    def exists(self, name: str) -> bool:
+        return name in self.pack
+
+    def open(self, name: str):
+        return io.BytesIO(self.pack.view(name))
+
+    def read(self, name: str) -> bytes:
+        return self.pack.read(name)
+
+    def image_input(self, name: str):
+        return self.pack.read(name)
+
+    def arrow_input(self, name: str):
+        # Zero-copy: pyarrow reads straight out of the mapped pack (imported lazily so the
+        # image pages do not pay for pyarrow)
+        import pyarrow as pa
+        return pa.BufferReader(pa.py_buffer(self.pack.view(name)))
+
+    def watch_path(self, name: str) -> Path:
+        return self.pack.path
+
+
+def open_source(data_dir: Path, pack_path: Path | None = None):
+    """The pack if `pack_path` exists, else the loose directory."""
+    if pack_path is not None and Path(pack_path).is_file():
+        return PackSource(pack_path)
+    return DirSource(data_dir)
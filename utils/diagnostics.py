@@ -0,0 +1,84 @@
+# utils/diagnostics.py
+"""
+Diagnostics view over utils/metrics.py: timing spans, cache counters, memory
+gauges and the export endpoints. Home.py renders it instead of the normal page
+when opened as `/?diagnostics=1`, so it never appears in the sidebar.
+"""
+import pandas as pd
+import streamlit as st
+
+from utils import metrics
+
+
+def _ms(seconds) -> float | None:
+    return None if seconds is None else seconds * 1e3
+
+
+def span_table(snap: dict) -> pd.DataFrame:
+    """One row per span, slowest total first."""
+    rows = [{
+        "span": s["name"],
+        "calls": s["count"],
+        "total s": s["sum_s"],
+        "mean ms": _ms(s["sum_s"] / max(s["count"], 1)),
+        "p50 ms": _ms(s["p50_s"]),
+        "p95 ms": _ms(s["p95_s"]),
+        "max ms": _ms(s["max_s"]),
+    } for s in snap["spans"]]
+    df = pd.DataFrame(rows, columns=["span", "calls", "total s", "mean ms", "p50 ms", "p95 ms", "max ms"])
+    return df.sort_values("total s", ascending=False)
+
+
+def cache_table(snap: dict) -> pd.DataFrame:
+    """One row per cache with its hit ratio."""
+    df = pd.DataFrame(snap["caches"], columns=["name", "kind", "hits", "misses", "evictions"])
+    df["hit ratio"] = df["hits"] / (df["hits"] + df["misses"]).clip(lower=1)
+    return df.rename(columns={"name": "cache"})
+
+
+def _fmt(name: str, value: float) -> str:
+    return f"{value / 2**20:,.0f} MB" if name.endswith("_bytes") else f"{value:,.0f}"
+
+
+def render():
+    st.title("🩺 Diagnostics")
+    st.caption("Metrics of this server process since it started (or since the last reset). "
+               "Cache hits include every session; evictions are recomputations of a key cached before.")
+    snap = metrics.snapshot()
+
+    if snap["gauges"]:
+        cols = st.columns(len(snap["gauges"]))
+        for col, g in zip(cols, snap["gauges"]):
+            col.metric(g["name"], _fmt(g["name"], g["value"]), help=g["help"] or None)
+
+    st.subheader("Timing spans")
+    spans = span_table(snap)
+    if spans.empty:
+        st.caption("Nothing timed yet: open the other pages first.")
+    else:
+        st.dataframe(spans, hide_index=True, use_container_width=True)
+
+    st.subheader("Caches")
+    caches = cache_table(snap)
+    if caches.empty:
+        st.caption("No cached function has been called yet.")
+    else:
+        st.dataframe(caches, hide_index=True, use_container_width=True)
+
+    st.subheader("Export")
+    status = metrics.exporter_status()
+    if status.get("http"):
+        st.write("Prometheus endpoint:", status["http"], "(JSON lines at `/metrics.jsonl`)")
+    elif status.get("http_error"):
+        st.warning(f"Metrics endpoint not started: {status['http_error']}")
+    else:
+        st.caption("Set `EUROAGRI_METRICS_PORT` to serve `/metrics` (Prometheus text) and `/metrics.jsonl`.")
+    if status.get("file"):
+        st.write(f"Appending JSON lines to {status['file']} every {status['interval_s']:.0f}s")
+
+    c1, c2, c3 = st.columns(3)
+    c1.download_button("Prometheus text", metrics.prometheus_text(snap), "euroagri_metrics.prom", "text/plain")
+    c2.download_button("JSON lines", metrics.json_lines(snap), "euroagri_metrics.jsonl", "application/x-ndjson")
+    if c3.button("Reset counters"):
+        metrics.reset()
+        st.rerun()
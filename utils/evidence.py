@@ -0,0 +1,276 @@
+# utils/evidence.py
+"""
+Evidence packs: the part of a crop's knowledge graph behind one recommendation.
+
+For a (region, year[, variety]) selection the retriever walks a fixed, typed
+path over the compiled CSR graph (utils/graph.py):
+
+    Region  -REGION_HAS_CLIMATE->      ClimateWindow (that year)
+            -CLIMATE_SUPPORTS_STAGE->  StageWindow
+    Plan    -PLAN_APPLIES_TO->         Region
+            -PLAN_USES_VARIETY->       Variety
+
+plus one extra hop of any other relation out of those nodes, which is where
+water-balance and disease-risk nodes hang. Every hop is capped at
+`max_per_hop` nodes, so dense regions cost the same as sparse ones. Packs
+are memoised per selection in a small LRU.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics, recs
+from utils.graph import CropGraph
+
+REGION_HAS_CLIMATE = "REGION_HAS_CLIMATE"
+CLIMATE_SUPPORTS_STAGE = "CLIMATE_SUPPORTS_STAGE"
+PLAN_APPLIES_TO = "PLAN_APPLIES_TO"
+PLAN_USES_VARIETY = "PLAN_USES_VARIETY"
+PATH_LABELS = (REGION_HAS_CLIMATE, CLIMATE_SUPPORTS_STAGE, PLAN_APPLIES_TO, PLAN_USES_VARIETY)
+
+# Node types are matched case-insensitively on these fragments, in order: the more
+# specific sections come first, so e.g. DiseaseStageRisk is disease, not stage
+SECTIONS = {
+    "disease": ("disease", "risk", "pathogen", "pest"),
+    "water": ("water", "irrig", "et0", "etc", "rain", "deficit"),
+    "stage": ("stage",),
+    "climate": ("climate",),
+    "plan": ("plan",),
+    "variety": ("variety", "cultivar"),
+    "region": ("region",),
+}
+
+# Attributes tried when matching a region code / variety name against graph nodes
+MATCH_ATTRS = ("region_iso", "iso", "nuts_id", "code", "name", "variety", "id")
+
+
+def section_of(node_type: str) -> str:
+    t = node_type.lower()
+    return next((s for s, keys in SECTIONS.items() if any(k in t for k in keys)), "other")
+
+
+@dataclass(frozen=True)
+class EvidencePack:
+    region: str | None
+    nodes: pd.DataFrame            # id, type, section, hop + node attributes
+    edges: pd.DataFrame            # source, target, label
+    truncated: bool = False
+    elapsed_ms: float = 0.0
+    counts: dict = field(default_factory=dict)
+
+    @property
+    def found(self) -> bool:
+        return self.region is not None
+
+    def section(self, name: str) -> pd.DataFrame:
+        """Nodes of one section ("stage", "water", "disease", ...), attributes as columns."""
+        if self.nodes.empty:
+            return self.nodes
+        df = self.nodes[self.nodes["section"] == name]
+        return df.dropna(axis=1, how="all")
+
+
+class EvidenceIndex:
+    """
+    Retrieval over one compiled crop graph. Thread-safe; share one instance per
+    graph through st.cache_resource.
+    """
+
+    def __init__(self, graph: CropGraph, max_per_hop: int = 200, cache_size: int = 256):
+        self.g = graph
+        self.max_per_hop = max_per_hop
+        self._vocab: dict = {}
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        region_types = [t for t in graph.node_types if section_of(t) == "region"]
+        self.regions = np.concatenate([graph.nodes_of_type(t) for t in region_types]) if region_types \
+            else np.empty(0, dtype=np.int64)
+
+    # --- Matching ---
+    def _codes_for(self, name: str, value: str) -> int:
+        """Dictionary code of `value` in string attribute `name` (-1 if absent)."""
+        vocab = self._vocab.get(name)
+        if vocab is None:
+            vocab = {str(v).lower(): i for i, v in enumerate(self.g.meta["node_attrs"][name]["values"])}
+            self._vocab[name] = vocab
+        return vocab.get(str(value).lower(), -1)
+
+    def match(self, candidates: np.ndarray, value) -> np.ndarray:
+        """The candidates whose id ("Type:value" or "value") or a key attribute equals `value`."""
+        if value is None or not len(candidates):
+            return candidates[:0]
+        want = str(value).lower()
+        ids = [i.lower() for i in self.g.node_ids(candidates)]
+        mask = np.fromiter((i == want or i.rsplit(":", 1)[-1] == want for i in ids), dtype=bool, count=len(ids))
+        specs = self.g.meta["node_attrs"]
+        for name in MATCH_ATTRS:
+            spec = specs.get(name)
+            if spec and spec["kind"] == "str":
+                code = self._codes_for(name, want)
+                if code >= 0:
+                    mask |= self.g.a[f"node.{spec['file']}"][candidates] == code
+        return candidates[mask]
+
+    def _in_year(self, idx: np.ndarray, year) -> np.ndarray:
+        """Nodes dated `year`; undated nodes are kept."""
+        if year is None or not len(idx):
+            return idx
+        values = self.g.node_attr("year", idx)
+        if values is None:
+            marker = str(int(year))
+            keep = [marker in i for i in self.g.node_ids(idx)]
+            return idx[np.asarray(keep, dtype=bool)] if any(keep) else idx
+        if isinstance(values, list):
+            keep = np.array([v is None or str(v).split(".")[0] == str(int(year)) for v in values], dtype=bool)
+        else:
+            keep = np.isnan(values) | (values == float(year))
+        return idx[keep]
+
+    def _cap(self, idx: np.ndarray) -> tuple[np.ndarray, bool]:
+        idx = np.unique(idx)
+        return (idx[:self.max_per_hop], True) if len(idx) > self.max_per_hop else (idx, False)
+
+    # --- Retrieval ---
+    def _retrieve(self, region, year, variety) -> EvidencePack:
+        t0 = time.perf_counter()
+        g = self.g
+        hit = self.match(self.regions, region)
+        if not len(hit):
+            return EvidencePack(None, pd.DataFrame(), pd.DataFrame(), elapsed_ms=(time.perf_counter() - t0) * 1e3)
+        r = hit[:1]
+        hops = {int(r[0]): 0}
+        edges = []
+        truncated = False
+
+        def take(origin, target, label, keep, hop, new=None):
+            # Record `label` edges whose new endpoint (default: target) survives the cap
+            nonlocal truncated
+            keep, cut = self._cap(keep)
+            truncated |= cut
+            sel = np.isin(target if new is None else new, keep)
+            edges.append((origin[sel], target[sel], label))
+            for i in keep.tolist():
+                hops.setdefault(i, hop)
+            return keep
+
+        # Hop 1: the region's climate windows for the year, and the plans that apply to it
+        o, t, _ = g.expand(r, REGION_HAS_CLIMATE)
+        climate = take(o, t, REGION_HAS_CLIMATE, self._in_year(np.unique(t), year), 1)
+        o, t, _ = g.expand(r, PLAN_APPLIES_TO, direction="in")
+        plans = self._in_year(np.unique(t), year)
+
+        # Hop 2: varieties (narrowing plans to the selected variety when it is in the graph)
+        po, pt, _ = g.expand(plans, PLAN_USES_VARIETY)
+        if variety is not None and len(pt):
+            chosen = self.match(np.unique(pt), variety)
+            if len(chosen):
+                plans = np.unique(po[np.isin(pt, chosen)])
+        plans = take(t, o, PLAN_APPLIES_TO, plans, 1, new=t)
+        sel = np.isin(po, plans)
+        take(po[sel], pt[sel], PLAN_USES_VARIETY, np.unique(pt[sel]), 2)
+
+        o, t, _ = g.expand(climate, CLIMATE_SUPPORTS_STAGE)
+        stages = take(o, t, CLIMATE_SUPPORTS_STAGE, np.unique(t), 2)
+
+        # Hop 3: any other relation out of the path nodes (water balance, disease risk, ...)
+        frontier = np.unique(np.concatenate([climate, plans, stages]))
+        o, t, eid = g.expand(frontier)
+        if len(eid):
+            labels = np.asarray(g.a["out_lbl"])[eid]
+            skip = [g.label_code(x) for x in PATH_LABELS]
+            for code in np.setdiff1d(np.unique(labels), skip).tolist():
+                sel = labels == code
+                take(o[sel], t[sel], g.edge_labels[code], np.unique(t[sel]), 3)
+
+        idx = np.fromiter(hops, dtype=np.int64, count=len(hops))
+        rows = []
+        for i in idx.tolist():
+            row = g.node_attrs(i)
+            row["section"] = section_of(row["type"])
+            row["hop"] = hops[i]
+            rows.append(row)
+        nodes = pd.DataFrame(rows)
+        lead = ["id", "type", "section", "hop"]
+        nodes = nodes[lead + [c for c in nodes.columns if c not in lead]].sort_values(["hop", "type", "id"])
+
+        src = np.concatenate([e[0] for e in edges]) if edges else np.empty(0, dtype=np.int64)
+        dst = np.concatenate([e[1] for e in edges]) if edges else np.empty(0, dtype=np.int64)
+        lbl = np.concatenate([np.full(len(e[0]), k) for k, e in enumerate(edges)]) if edges else np.empty(0, int)
+        edge_df = pd.DataFrame({
+            "source": g.node_ids(src),
+            "target": g.node_ids(dst),
+            "label": pd.Categorical.from_codes(lbl, categories=[e[2] for e in edges]) if edges else [],
+        }).drop_duplicates()
+
+        counts = nodes["section"].value_counts().to_dict()
+        return EvidencePack(g.node_id(int(r[0])), nodes.reset_index(drop=True), edge_df.reset_index(drop=True),
+                            truncated, (time.perf_counter() - t0) * 1e3, counts)
+
+    def pack(self, region, year=None, variety=None) -> EvidencePack:
+        """Evidence pack for one recommendation row (memoised)."""
+        key = (str(region), None if year is None else int(year), None if variety is None else str(variety))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                metrics.cache_event("evidence.pack", "hit")
+                return self._cache[key]
+        metrics.cache_event("evidence.pack", "miss")
+        with metrics.span("graph.evidence"):
+            result = self._retrieve(*key)
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+                metrics.cache_event("evidence.pack", "eviction")
+        return result
+
+
+def entity_key(g: CropGraph, i: int) -> str:
+    """The value a region/variety node is known by in the recommendation tables."""
+    for name in MATCH_ATTRS:
+        v = g.node_attr(name, i)
+        if isinstance(v, str) and v:
+            return v
+    return g.node_id(i).rsplit(":", 1)[-1]
+
+
+def anchors(g: CropGraph, i: int, max_fanout: int = 64) -> dict:
+    """
+    {"region", "variety", "year"} a node is about: taken from the node itself or
+    the nearest region/variety nodes within two hops (fan-out capped per hop).
+    """
+    out = {}
+    frontier = np.asarray([i], dtype=np.int64)
+    for _ in range(3):
+        for j in frontier.tolist():
+            sec = section_of(g.type_of(j))
+            if sec in ("region", "variety") and sec not in out:
+                out[sec] = entity_key(g, j)
+        if len(out) == 2:
+            break
+        _, out_nb, _ = g.expand(frontier)
+        _, in_nb, _ = g.expand(frontier, direction="in")
+        frontier = np.unique(np.concatenate([out_nb, in_nb]))[:max_fanout]
+    year = g.node_attr("year", i)
+    if isinstance(year, str):
+        year = year.split(".")[0]
+        out["year"] = int(year) if year.isdigit() else None
+    elif year is not None and not np.isnan(year):
+        out["year"] = int(year)
+    return out
+
+
+def supporting_rows(df: pd.DataFrame, region, year=None, crop=None, variety=None) -> pd.DataFrame:
+    """Recommendation rows sharing the selection's (region, crop, year[, variety]), best plan first."""
+    mask = recs.frame_mask(df, crop=crop, region=region, years=None if year is None else [year])
+    if variety is not None and "variety" in df.columns:
+        mask &= (df["variety"] == variety).to_numpy()
+    out = df.loc[mask]
+    return out.sort_values("plan_score", ascending=False) if "plan_score" in out.columns else out
@@ -0,0 +1,74 @@
+# utils/gallery.py
+"""
+Shared gallery helpers for the snapshot pages.
+
+Grid cells show cached thumbnails (utils/thumbs.py). The full-resolution PNG
+is only sent to the browser when a user opens one snapshot in a dialog.
+
+Renditions for the visible page are produced concurrently on a process-wide
+thread pool (`prepare`), and the next page can be warmed in the background
+(`prefetch`) while the user is still looking at the current one.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+
+from utils import metrics, thumbs
+from utils.paths import image_input
+
+
+# Decoding/resizing releases the GIL inside Pillow, so threads scale on multi-core hosts
+_POOL = ThreadPoolExecutor(max_workers=6, thread_name_prefix="thumbs")
+# Background warming gets its own small pool, so visible thumbnails never queue behind it
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbs-prefetch")
+_inflight: set = set()
+_inflight_lock = threading.Lock()
+
+
+def prepare(paths, width: int = thumbs.GALLERY_WIDTH) -> dict:
+    """Thumbnails for `paths`, rendered concurrently; returns {path: rendition path}."""
+    paths = [Path(p) for p in paths]
+    return dict(zip(paths, _POOL.map(lambda p: thumbs.thumbnail(p, width), paths)))
+
+
+def prefetch(paths, width: int = thumbs.GALLERY_WIDTH):
+    """Warm the thumbnail cache for `paths` in the background; returns immediately."""
+    def work(p):
+        try:
+            thumbs.thumbnail(p, width)
+        finally:
+            with _inflight_lock:
+                _inflight.discard((p, width))
+
+    for p in map(Path, paths):
+        with _inflight_lock:
+            if (p, width) in _inflight:
+                continue
+            _inflight.add((p, width))
+        _PREFETCH_POOL.submit(work, p)
+
+
+@st.dialog("Snapshot", width="large")
+def show_full_size(path: str):
+    """Modal with the original, full-resolution image."""
+    st.image(image_input(path), caption=Path(path).name, use_container_width=True)
+
+
+def show_image(col, path: Path, caption: str, width: int = thumbs.GALLERY_WIDTH, thumb: Path | None = None):
+    """
+    Render a thumbnail of `path` into a grid cell, with a button opening the full image.
+    Pass `thumb` when it was already produced by prepare().
+    """
+    path = Path(path)
+    thumb = thumb or thumbs.thumbnail(path, width)
+    with metrics.span("image.render"):
+        try:
+            col.image(image_input(thumb), caption=caption, use_container_width=True)
+        except Exception:
+            # Rendition evicted by another process since we last saw it: serve the original
+            thumbs.forget(thumb)
+            col.image(image_input(path), caption=caption, use_container_width=True)
+    if col.button("🔍 Full size", key=f"full::{path}"):
+        show_full_size(str(path))
@@ -0,0 +1,411 @@
+# utils/graph.py
+"""
+Compact, array-backed view of the per-crop knowledge graphs.
+
+`graph_crop_{crop}.graphml` is streamed once (no networkx) into:
+
+* node ids as a sorted fixed-width byte array (lookup = binary search),
+* node types and edge labels as small integer codes,
+* forward and reverse CSR adjacency, each row sorted by edge label, so
+  "all PLAN_APPLIES_TO edges of this node" is one slice,
+* node/edge attributes as float arrays (numeric) or dictionary codes (text).
+
+The compiled arrays are written to `_app_cache/graphs/<stem>-<hash>/` as .npy
+files and memory-mapped on load, so every worker shares one copy through the
+OS page cache and no Python object is allocated per node or edge.
+
+    python -m utils.graph compile          # compile every graph_crop_*.graphml up front
+    python -m utils.graph stats --crop maize
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+from utils import metrics
+from utils.paths import DATA_DIR, GRAPH_DIR, asset_stat, graph_crops, graphml, open_asset
+
+FORMAT_VERSION = 1
+
+# GraphML data keys that carry the node type / edge label, in order of preference
+NODE_TYPE_KEYS = ("node_type", "type", "label", "kind", "labels")
+EDGE_LABEL_KEYS = ("rel", "relation", "type", "label", "edge_type")
+UNTYPED = "Node"
+UNLABELLED = "RELATED_TO"
+
+_NUMERIC = {"int", "long", "float", "double", "boolean"}
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _node_type(node_id: str, data: dict) -> str:
+    for k in NODE_TYPE_KEYS:
+        if data.get(k):
+            return str(data[k]).strip(":")
+    # Pipeline ids look like "Region:FR10" when no explicit type is exported
+    head, sep, _ = node_id.partition(":")
+    return head if sep and head else UNTYPED
+
+
+def _edge_label(data: dict) -> str:
+    for k in EDGE_LABEL_KEYS:
+        if data.get(k):
+            return str(data[k])
+    return UNLABELLED
+
+
+def parse_graphml(fh):
+    """
+    Stream a GraphML file. Returns (keys, nodes, edges) where keys maps
+    attr name -> attr.type, nodes is [(id, {attr: text})] and edges is
+    [(source, target, {attr: text})].
+    """
+    key_names, key_types, defaults = {}, {}, {}
+    nodes, edges = [], []
+    for _, elem in ET.iterparse(fh, events=("end",)):
+        tag = _local(elem.tag)
+        if tag == "key":
+            name = elem.get("attr.name") or elem.get("id")
+            key_names[elem.get("id")] = name
+            key_types[name] = elem.get("attr.type", "string")
+            for child in elem:
+                if _local(child.tag) == "default" and child.text is not None:
+                    defaults[(elem.get("for", "all"), name)] = child.text
+        elif tag in ("node", "edge"):
+            data = {k: v for (scope, k), v in defaults.items() if scope in (tag, "all")}
+            for child in elem:
+                if _local(child.tag) == "data":
+                    data[key_names.get(child.get("key"), child.get("key"))] = child.text or ""
+            if tag == "node":
+                nodes.append((elem.get("id"), data))
+            else:
+                edges.append((elem.get("source"), elem.get("target"), data))
+            elem.clear()
+    return key_types, nodes, edges
+
+
+def _codes(values) -> tuple[np.ndarray, list]:
+    """Dictionary-encode a list of strings (None = missing, code -1)."""
+    vocab: dict = {}
+    codes = np.fromiter((-1 if v is None else vocab.setdefault(v, len(vocab)) for v in values),
+                        dtype=np.int32, count=len(values))
+    return codes, list(vocab)
+
+
+def _attr_columns(rows, key_types: dict, skip: set) -> tuple[dict, dict]:
+    """{name: array} plus JSON-able {name: spec} for every attribute seen on `rows`."""
+    names = sorted({k for data in rows for k in data} - skip)
+    arrays, specs = {}, {}
+    for i, name in enumerate(names):
+        raw = [data.get(name) for data in rows]
+        if key_types.get(name, "string") in _NUMERIC:
+            arr = np.full(len(raw), np.nan)
+            for j, v in enumerate(raw):
+                if v not in (None, ""):
+                    try:
+                        arr[j] = 1.0 if v == "true" else 0.0 if v == "false" else float(v)
+                    except ValueError:
+                        pass
+            specs[name] = {"file": f"a{i}", "kind": "num"}
+        else:
+            arr, vocab = _codes(raw)
+            specs[name] = {"file": f"a{i}", "kind": "str", "values": vocab}
+        arrays[f"a{i}"] = arr
+    return arrays, specs
+
+
+def _csr(n: int, src: np.ndarray, lbl: np.ndarray, dst: np.ndarray):
+    """Rows of `src`, each sorted by (label, dst). Returns (ptr, dst, lbl, order)."""
+    order = np.lexsort((dst, lbl, src))
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+    return ptr, dst[order].astype(np.int32), lbl[order], order
+
+
+def compile_graph(fh) -> tuple[dict, dict]:
+    """Parse GraphML from a binary file object into (arrays, meta)."""
+    key_types, nodes, edges = parse_graphml(fh)
+
+    # Edges may name nodes that were never declared; GraphML readers create those implicitly
+    declared = {nid for nid, _ in nodes}
+    extra = {e for s, t, _ in edges for e in (s, t)} - declared
+    nodes.extend((nid, {}) for nid in sorted(extra))
+    nodes.sort(key=lambda item: item[0].encode())
+
+    ids = np.array([nid.encode() for nid, _ in nodes], dtype=bytes)
+    node_type, node_types = _codes([_node_type(nid, data) for nid, data in nodes])
+    node_arrays, node_specs = _attr_columns([data for _, data in nodes], key_types, {"node_type"})
+
+    n = len(ids)
+    src = np.searchsorted(ids, np.array([s.encode() for s, _, _ in edges], dtype=bytes)).astype(np.int64)
+    dst = np.searchsorted(ids, np.array([t.encode() for _, t, _ in edges], dtype=bytes)).astype(np.int64)
+    lbl, edge_labels = _codes([_edge_label(data) for _, _, data in edges])
+    out_ptr, out_dst, out_lbl, order = _csr(n, src, lbl, dst)
+
+    # Edge attributes are stored in forward-CSR order, so a forward edge position is its id
+    edge_rows = [edges[i][2] for i in order]
+    edge_arrays, edge_specs = _attr_columns(edge_rows, key_types, {"rel", "relation", "edge_type"})
+    in_ptr, in_src, in_lbl, in_order = _csr(n, dst[order], lbl[order], src[order])
+
+    arrays = {
+        "ids": ids,
+        "node_type": node_type.astype(np.uint16),
+        "out_ptr": out_ptr, "out_dst": out_dst, "out_lbl": out_lbl.astype(np.uint16),
+        "in_ptr": in_ptr, "in_src": in_src, "in_lbl": in_lbl.astype(np.uint16),
+        "in_eid": in_order.astype(np.int32),
+        **{f"node.{k}": v for k, v in node_arrays.items()},
+        **{f"edge.{k}": v for k, v in edge_arrays.items()},
+    }
+    meta = {
+        "version": FORMAT_VERSION,
+        "node_types": node_types,
+        "edge_labels": edge_labels,
+        "node_attrs": node_specs,
+        "edge_attrs": edge_specs,
+    }
+    return arrays, meta
+
+
+class CropGraph:
+    """Read-only CSR graph. Nodes are addressed by integer index; see node()/node_id()."""
+
+    def __init__(self, arrays: dict, meta: dict, source: str = ""):
+        self.a = arrays
+        self.meta = meta
+        self.source = source
+        self.node_types = meta["node_types"]
+        self.edge_labels = meta["edge_labels"]
+        self._type_code = {t: i for i, t in enumerate(self.node_types)}
+        self._label_code = {t: i for i, t in enumerate(self.edge_labels)}
+
+    # --- Sizes ---
+    @property
+    def n_nodes(self) -> int:
+        return len(self.a["ids"])
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.a["out_dst"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(v.nbytes) for v in self.a.values())
+
+    # --- Nodes ---
+    def node(self, node_id: str) -> int:
+        """Index of `node_id`, or -1."""
+        ids = self.a["ids"]
+        key = node_id.encode()
+        i = int(np.searchsorted(ids, key))
+        return i if i < len(ids) and ids[i] == key else -1
+
+    def node_id(self, i: int) -> str:
+        return bytes(self.a["ids"][i]).decode()
+
+    def node_ids(self, idx) -> list:
+        return [bytes(b).decode() for b in self.a["ids"][np.asarray(idx)]]
+
+    def type_of(self, i: int) -> str:
+        return self.node_types[self.a["node_type"][i]]
+
+    def nodes_of_type(self, node_type: str) -> np.ndarray:
+        code = self._type_code.get(node_type)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.a["node_type"] == code)
+
+    # --- Attributes ---
+    def _attr(self, scope: str, name: str, idx):
+        spec = self.meta[f"{scope}_attrs"].get(name)
+        if spec is None:
+            return None
+        raw = self.a[f"{scope}.{spec['file']}"][idx]
+        if spec["kind"] == "num":
+            return raw
+        values = spec["values"]
+        if np.ndim(raw) == 0:
+            return values[raw] if raw >= 0 else None
+        return [values[c] if c >= 0 else None for c in raw]
+
+    def node_attr(self, name: str, idx):
+        """Attribute `name` of node(s) `idx` (float for numeric keys, str/None otherwise)."""
+        return self._attr("node", name, idx)
+
+    def edge_attr(self, name: str, eid):
+        return self._attr("edge", name, eid)
+
+    def node_attrs(self, i: int) -> dict:
+        out = {"id": self.node_id(i), "type": self.type_of(i)}
+        for name in self.meta["node_attrs"]:
+            if name in out:
+                continue
+            v = self.node_attr(name, i)
+            if v is not None and not (isinstance(v, float) and np.isnan(v)):
+                out[name] = v.item() if hasattr(v, "item") else v
+        return out
+
+    # --- Adjacency ---
+    def label_code(self, label: str) -> int:
+        return self._label_code.get(label, -1)
+
+    def _row(self, i: int, label: str | None, direction: str):
+        if direction == "out":
+            ptr, lbl = self.a["out_ptr"], self.a["out_lbl"]
+        else:
+            ptr, lbl = self.a["in_ptr"], self.a["in_lbl"]
+        lo, hi = int(ptr[i]), int(ptr[i + 1])
+        if label is not None:
+            code = self.label_code(label)
+            if code < 0:
+                return lo, lo
+            row = lbl[lo:hi]
+            lo, hi = lo + int(np.searchsorted(row, code, "left")), lo + int(np.searchsorted(row, code, "right"))
+        return lo, hi
+
+    def neighbors(self, i: int, label: str | None = None, direction: str = "out") -> np.ndarray:
+        """Node indices adjacent to `i` over `label` edges ("out", "in" or "both")."""
+        if direction == "both":
+            return np.union1d(self.neighbors(i, label, "out"), self.neighbors(i, label, "in"))
+        lo, hi = self._row(i, label, direction)
+        return self.a["out_dst" if direction == "out" else "in_src"][lo:hi]
+
+    def edges(self, i: int, label: str | None = None, direction: str = "out") -> np.ndarray:
+        """Edge ids (for edge_attr) of `i`'s `label` edges."""
+        lo, hi = self._row(i, label, direction)
+        if direction == "out":
+            return np.arange(lo, hi)
+        return self.a["in_eid"][lo:hi]
+
+    def expand(self, frontier, label: str | None = None, direction: str = "out"):
+        """
+        One hop from every node in `frontier` at once.
+        Returns (origin, neighbour, edge_id) arrays, one entry per traversed edge.
+        """
+        frontier = np.asarray(frontier, dtype=np.int64)
+        if direction == "out":
+            ptr, lbl, other = self.a["out_ptr"], self.a["out_lbl"], self.a["out_dst"]
+        else:
+            ptr, lbl, other = self.a["in_ptr"], self.a["in_lbl"], self.a["in_src"]
+        starts, ends = ptr[frontier], ptr[frontier + 1]
+        counts = ends - starts
+        pos = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        origin = np.repeat(frontier, counts)
+        if label is not None:
+            keep = lbl[pos] == self.label_code(label)
+            pos, origin = pos[keep], origin[keep]
+        eid = pos if direction == "out" else self.a["in_eid"][pos]
+        return origin, other[pos], eid
+
+    def label_counts(self) -> dict:
+        counts = np.bincount(self.a["out_lbl"], minlength=len(self.edge_labels))
+        return dict(zip(self.edge_labels, counts.tolist()))
+
+
+# --- Compiled cache ---
+def compiled_dir(src: Path, stamp, graph_dir: Path = GRAPH_DIR) -> Path:
+    h = hashlib.blake2b(f"{src}|{stamp}|{FORMAT_VERSION}".encode(), digest_size=6).hexdigest()
+    return Path(graph_dir) / f"{Path(src).stem}-{h}"
+
+
+def _save(out: Path, arrays: dict, meta: dict, prefix: str):
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, arr in arrays.items():
+        np.save(tmp / f"{name}.npy", arr)
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    try:
+        os.rename(tmp, out)
+    except OSError:
+        # Another worker got there first; its copy is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+    # Older compilations of the same file are dead weight
+    for old in out.parent.glob(f"{prefix}-*"):
+        if old != out and old.is_dir() and old.name.rsplit("-", 1)[0] == prefix:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _load_array(p: Path) -> np.ndarray:
+    try:
+        return np.load(p, mmap_mode="r")
+    except ValueError:
+        # Zero-length arrays cannot be mapped
+        return np.load(p)
+
+
+def _open(out: Path):
+    meta = json.loads((out / "meta.json").read_text())
+    if meta.get("version") != FORMAT_VERSION:
+        return None
+    arrays = {p.stem: _load_array(p) for p in out.glob("*.npy")}
+    return arrays, meta
+
+
+def load(src: Path, graph_dir: Path = GRAPH_DIR) -> CropGraph | None:
+    """
+    The compiled graph for a GraphML asset, compiling it on first use.
+    Returns None if `src` does not exist. Falls back to an in-memory graph when
+    the cache directory is not writable.
+    """
+    src = Path(src)
+    stamp = asset_stat(src)
+    if stamp is None:
+        return None
+    out = compiled_dir(src, stamp, graph_dir)
+    try:
+        opened = _open(out)
+        if opened:
+            return CropGraph(*opened, source=str(src))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open_asset(src) as fh:
+            arrays, meta = compile_graph(fh)
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid GraphML in {src}: {e}") from e
+    try:
+        _save(out, arrays, meta, src.stem)
+        return CropGraph(*_open(out), source=str(src))
+    except (OSError, ValueError):
+        return CropGraph(arrays, meta, source=str(src))
+
+
+@metrics.timed("load.graph")
+def load_crop(crop: str, graph_dir: Path = GRAPH_DIR) -> CropGraph | None:
+    return load(graphml(crop), graph_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile graph_crop_*.graphml into cached CSR arrays.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compile", help="compile graphs (all crops by default)")
+    c.add_argument("--crop", action="append", help="crop to compile (repeatable)")
+    s = sub.add_parser("stats", help="print node/edge counts for one crop")
+    s.add_argument("--crop", required=True)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "stats":
+        crops = [args.crop]
+    else:
+        crops = args.crop or graph_crops()
+    for crop in crops:
+        g = load_crop(crop)
+        if g is None:
+            print(f"{crop}: no {graphml(crop).name} in {DATA_DIR}")
+            continue
+        print(f"{crop}: {g.n_nodes} nodes, {g.n_edges} edges, {g.nbytes / 2**20:.1f} MiB")
+        if args.cmd == "stats":
+            for label, n in sorted(g.label_counts().items(), key=lambda kv: -kv[1]):
+                print(f"  {n:>9}  {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# utils/linkcube.py
+"""
+Climate -> stage link-density cube.
+
+Counts CLIMATE_SUPPORTS_STAGE edges per
+
+    crop / country / region_iso / year / month / stage
+
+straight from the compiled crop graphs (utils/graph.py): every edge of that
+label is attributed to its ClimateWindow's region (via REGION_HAS_CLIMATE),
+year and month and to its StageWindow's stage, all with array operations.
+
+The cube is stored as one small parquet per crop under `_app_cache/linkcube/`
+together with `_sources.json` (the GraphML stamp each crop was built from),
+so a refresh only recounts crops whose export changed. Roll-ups and slices
+are plain pandas group-bys over a few thousand rows.
+
+    python -m utils.linkcube build
+"""
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils import evidence, graph as kg, metrics
+from utils.paths import CUBE_DIR, asset_stat, graph_crops, graphml
+
+DIMS = ["crop", "country", "region_iso", "year", "month", "stage"]
+MEASURE = "links"
+SOURCES_NAME = "_sources.json"
+
+# Node attributes tried, in order, for each cube dimension
+MONTH_ATTRS = ("month", "start_month", "start_date", "start", "date")
+STAGE_ATTRS = ("stage", "stage_name", "phase", "name")
+COUNTRY_ATTRS = ("country", "country_iso")
+
+_YEAR = re.compile(r"(?<!\d)(?:19|20)\d\d(?!\d)")
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+
+# --- Per-node dimension values (loops run over dictionaries, not edges) ---
+def _as_month(v) -> int:
+    s = str(v).strip().lower()
+    if s[:3] in _MONTHS:
+        return _MONTHS[s[:3]]
+    if s.split(".")[0].isdigit():
+        m = int(s.split(".")[0])
+        return m if 1 <= m <= 12 else 0
+    ts = pd.to_datetime(s, errors="coerce")
+    return 0 if pd.isna(ts) else int(ts.month)
+
+
+def _attr_values(g: kg.CropGraph, names, idx: np.ndarray, convert, missing):
+    """
+    Per-node value of the first attribute in `names` that a node has, mapped
+    through `convert` once per distinct value. Nodes with none get `missing`.
+    """
+    out = np.full(len(idx), missing, dtype=object)
+    todo = np.ones(len(idx), dtype=bool)
+    for name in names:
+        spec = g.meta["node_attrs"].get(name)
+        if spec is None or not todo.any():
+            continue
+        raw = np.asarray(g.a[f"node.{spec['file']}"])[idx]
+        if spec["kind"] == "num":
+            has = todo & ~np.isnan(raw)
+            uniq, inv = np.unique(raw[has], return_inverse=True)
+        else:
+            has = todo & (raw >= 0)
+            codes, inv = np.unique(raw[has], return_inverse=True)
+            uniq = [spec["values"][c] for c in codes]
+        if has.any():
+            out[has] = np.array([convert(v) for v in uniq], dtype=object)[inv]
+        todo &= ~has
+    return out, todo
+
+
+def _years(g: kg.CropGraph, idx: np.ndarray) -> np.ndarray:
+    def to_year(v):
+        m = _YEAR.search(str(v).split(".")[0])
+        return int(m.group()) if m else 0
+    years, todo = _attr_values(g, ("year",), idx, to_year, 0)
+    if todo.any():
+        years[todo] = [to_year(i) for i in g.node_ids(idx[todo])]
+    return years.astype(np.int32)
+
+
+def _stages(g: kg.CropGraph, idx: np.ndarray) -> np.ndarray:
+    stages, todo = _attr_values(g, STAGE_ATTRS, idx, lambda v: str(v).strip().lower(), "")
+    if todo.any():
+        # "StageWindow:wheat_flowering_2019" -> "flowering"
+        words = [re.findall(r"[a-z]+", i.rsplit(":", 1)[-1].lower()) for i in g.node_ids(idx[todo])]
+        stages[todo] = [w[-1] if w else "unknown" for w in words]
+    return stages
+
+
+def crop_cube(g: kg.CropGraph, crop: str) -> pd.DataFrame:
+    """Link counts for one crop graph, one row per populated cube cell."""
+    cols = DIMS + [MEASURE]
+    code = g.label_code(evidence.CLIMATE_SUPPORTS_STAGE)
+    if code < 0:
+        return pd.DataFrame(columns=cols)
+    ptr, lbl = np.asarray(g.a["out_ptr"]), np.asarray(g.a["out_lbl"])
+    src_all = np.repeat(np.arange(g.n_nodes, dtype=np.int64), np.diff(ptr))
+    sel = lbl == code
+    climate, stage = src_all[sel], np.asarray(g.a["out_dst"])[sel].astype(np.int64)
+    if not len(climate):
+        return pd.DataFrame(columns=cols)
+
+    # Region of every climate window, from its REGION_HAS_CLIMATE in-edge
+    region_of = np.full(g.n_nodes, -1, dtype=np.int64)
+    rcode = g.label_code(evidence.REGION_HAS_CLIMATE)
+    if rcode >= 0:
+        rsel = lbl == rcode
+        region_of[np.asarray(g.a["out_dst"])[rsel]] = src_all[rsel]
+
+    windows, w_inv = np.unique(climate, return_inverse=True)
+    stage_nodes, s_inv = np.unique(stage, return_inverse=True)
+    regions = region_of[windows]
+    region_nodes, r_inv = np.unique(regions, return_inverse=True)
+
+    region_codes = np.array([evidence.entity_key(g, r) if r >= 0 else "" for r in region_nodes.tolist()],
+                            dtype=object)
+    countries, todo = _attr_values(g, COUNTRY_ATTRS, np.maximum(region_nodes, 0), str, "")
+    countries[todo] = [c.split("-")[0][:2].upper() for c in region_codes[todo]]
+    countries[region_nodes < 0] = ""
+
+    months, _ = _attr_values(g, MONTH_ATTRS, windows, _as_month, 0)
+    cells = pd.DataFrame({
+        "crop": crop,
+        "country": countries[r_inv][w_inv],
+        "region_iso": region_codes[r_inv][w_inv],
+        "year": _years(g, windows)[w_inv],
+        "month": months.astype(np.int8)[w_inv],
+        "stage": _stages(g, stage_nodes)[s_inv],
+    })
+    cube = cells.groupby(DIMS, sort=True, observed=True).size().rename(MEASURE).reset_index()
+    cube[MEASURE] = cube[MEASURE].astype(np.int32)
+    return cube
+
+
+# --- Storage ---
+def cube_path(crop: str, cube_dir: Path = CUBE_DIR) -> Path:
+    return Path(cube_dir) / f"{crop}.parquet"
+
+
+def read_sources(cube_dir: Path = CUBE_DIR) -> dict:
+    p = Path(cube_dir) / SOURCES_NAME
+    try:
+        return json.loads(p.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def refresh(crops=None, cube_dir: Path = CUBE_DIR, force: bool = False) -> list:
+    """Recount crops whose GraphML changed since the last build; returns the crops rebuilt."""
+    cube_dir = Path(cube_dir)
+    crops = list(crops) if crops is not None else graph_crops()
+    sources = read_sources(cube_dir)
+    rebuilt = []
+    for crop in crops:
+        stamp = asset_stat(graphml(crop))
+        if stamp is None or (not force and sources.get(crop) == list(stamp) and cube_path(crop, cube_dir).exists()):
+            continue
+        g = kg.load_crop(crop)
+        if g is None:
+            continue
+        cube_dir.mkdir(parents=True, exist_ok=True)
+        out = cube_path(crop, cube_dir)
+        tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+        crop_cube(g, crop).to_parquet(tmp, index=False)
+        os.replace(tmp, out)
+        sources[crop] = list(stamp)
+        rebuilt.append(crop)
+    if rebuilt:
+        tmp = cube_dir / f".{SOURCES_NAME}.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(sources, indent=2))
+        os.replace(tmp, cube_dir / SOURCES_NAME)
+    return rebuilt
+
+
+def _combine(frames) -> pd.DataFrame:
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=DIMS + [MEASURE])
+    cube = pd.concat(frames, ignore_index=True)
+    for c in ("crop", "country", "region_iso", "stage"):
+        cube[c] = cube[c].astype("category")
+    return cube
+
+
+def load(crops=None, cube_dir: Path = CUBE_DIR) -> pd.DataFrame:
+    """The stored cube for `crops` (all built crops by default), keys as categoricals."""
+    crops = list(crops) if crops is not None else sorted(read_sources(cube_dir))
+    return _combine(pd.read_parquet(cube_path(c, cube_dir)) for c in crops if cube_path(c, cube_dir).exists())
+
+
+@metrics.timed("load.linkcube")
+def ensure(crops=None, cube_dir: Path = CUBE_DIR) -> pd.DataFrame:
+    """Refresh, then load; counts in memory instead when the cache directory is not writable."""
+    crops = list(crops) if crops is not None else graph_crops()
+    try:
+        refresh(crops, cube_dir)
+        return load(crops, cube_dir)
+    except OSError:
+        graphs = {c: kg.load_crop(c) for c in crops}
+        return _combine(crop_cube(g, c) for c, g in graphs.items() if g is not None)
+
+
+# --- Queries ---
+def slice_cube(cube: pd.DataFrame, **filters) -> pd.DataFrame:
+    """Rows whose dimension values are in the given lists (None/empty = no filter)."""
+    mask = np.ones(len(cube), dtype=bool)
+    for col, values in filters.items():
+        if values:
+            mask &= cube[col].isin(list(values)).to_numpy()
+    return cube.loc[mask]
+
+
+def rollup(cube: pd.DataFrame, by, **filters) -> pd.DataFrame:
+    """Total links per combination of `by` dimensions, after slicing."""
+    by = [by] if isinstance(by, str) else list(by)
+    out = slice_cube(cube, **filters).groupby(by, observed=True, sort=True)[MEASURE].sum()
+    return out.reset_index()
+
+
+def matrix(cube: pd.DataFrame, rows: str, cols: str, **filters) -> pd.DataFrame:
+    """rows x cols table of link counts (0 where no links) for a heatmap."""
+    df = rollup(cube, [rows, cols], **filters)
+    return df.pivot_table(index=rows, columns=cols, values=MEASURE, aggfunc="sum", fill_value=0, observed=True)
+
+
+def ranking(cube: pd.DataFrame, by: str = "region_iso", n: int = 20, **filters) -> pd.DataFrame:
+    """Top `n` values of `by` by total links, with their share of the slice and windows' stage spread."""
+    df = slice_cube(cube, **filters)
+    if df.empty:
+        return pd.DataFrame(columns=[by, MEASURE, "share", "stages"])
+    out = df.groupby(by, observed=True).agg(**{MEASURE: (MEASURE, "sum"), "stages": ("stage", "nunique")})
+    out["share"] = out[MEASURE] / max(int(out[MEASURE].sum()), 1)
+    out = out.sort_values(MEASURE, ascending=False).head(n).reset_index()
+    return out[[by, MEASURE, "share", "stages"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the climate -> stage link-density cube.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="recount new or changed crop graphs")
+    b.add_argument("--crop", action="append", help="crop to count (repeatable)")
+    b.add_argument("--force", action="store_true", help="recount even if unchanged")
+    args = parser.parse_args(argv)
+
+    rebuilt = refresh(args.crop, force=args.force)
+    print(f"Rebuilt: {', '.join(rebuilt) if rebuilt else 'nothing (all crops up to date)'}")
+    cube = load()
+    print(f"{len(cube)} cells, {int(cube[MEASURE].sum()) if len(cube) else 0} links across {cube['crop'].nunique()} crops")
+
+
+if __name__ == "__main__":
+    main()
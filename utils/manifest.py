@@ -0,0 +1,193 @@
+# utils/manifest.py
+"""
+Persistent asset manifest for the crop_app_data assets.
+
+One SQLite table holds every file name of the data source (a directory or an
+asset pack, see utils/datasource.py) with the fields parsed
+from the pipeline's naming patterns (kind, crop, region, country, year,
+window_no). Pages query it instead of globbing and stat-ing the directory,
+which is slow on the /mnt/d (9p) mount.
+
+A refresh costs one stat of the directory (or pack) when nothing changed.
+Otherwise it lists the source once and only stats and parses names it has not
+seen before or whose change token moved (a new inode when the pipeline
+replaces a file by rename); names that disappeared are dropped.
+"""
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from utils import metrics
+
+# (kind, pattern) in match order; crop names never contain "_"
+PATTERNS = [
+    ("crop", re.compile(
+        r"^subgraph_crop_(?P<crop>[^_]+?)"
+        r"(?:_(?P<variant>matrix|climate_matrix|climate|disease_matrix|disease))?\.png$")),
+    ("season", re.compile(r"^subgraph_season_(?P<region>.+)_(?P<year>\d{4})_(?P<crop>[^_]+)\.png$")),
+    ("climate", re.compile(r"^subgraph_climate_(?P<region>.+)_(?P<year>\d{4})_(?P<window_no>\d+)\.png$")),
+    ("graphml", re.compile(r"^graph_crop_(?P<crop>.+)\.graphml$")),
+    ("schema", re.compile(r"^schema_metagraph\.png$")),
+]
+
+COLUMNS = ["name", "kind", "crop", "region", "country", "year", "window_no", "size", "mtime_ns", "token"]
+
+# Bump when COLUMNS change; an older database is rebuilt from scratch
+SCHEMA_VERSION = "3"
+
+# Re-check the directory at most this often per process (seconds)
+MIN_REFRESH_INTERVAL = 2.0
+
+
+def parse_name(name: str) -> dict:
+    """Fields encoded in an asset file name; kind is "other" for unknown names."""
+    for kind, rx in PATTERNS:
+        m = rx.match(name)
+        if not m:
+            continue
+        g = m.groupdict()
+        if kind == "crop" and g.get("variant"):
+            kind = f"crop_{g['variant']}"
+        region = g.get("region")
+        return {
+            "kind": kind,
+            "crop": g.get("crop"),
+            "region": region,
+            "country": (region.split("-")[0] if "-" in region else "??") if region else None,
+            "year": int(g["year"]) if g.get("year") else None,
+            "window_no": int(g["window_no"]) if g.get("window_no") else None,
+        }
+    return {"kind": "other", "crop": None, "region": None, "country": None, "year": None, "window_no": None}
+
+
+class Manifest:
+    """SQLite-backed index of one data source; safe to share between threads."""
+
+    def __init__(self, source, db_path: Path):
+        self.source = source
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._checked = 0.0
+        try:
+            # Only the cache directory itself: creating its parents could fabricate a missing data mount
+            self.db_path.parent.mkdir(exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._init_schema()
+        except (OSError, sqlite3.Error):
+            # Read-only data mount: keep the index in memory for this process
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._init_schema()
+        self._tokens = dict(self._conn.execute("SELECT name, token FROM assets"))
+
+    def _init_schema(self):
+        c = self._conn
+        c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self._meta("schema_version") != SCHEMA_VERSION:
+            c.execute("DROP TABLE IF EXISTS assets")
+            c.execute("DELETE FROM meta")
+            c.execute("INSERT INTO meta VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS assets ("
+            "name TEXT PRIMARY KEY, kind TEXT, crop TEXT, region TEXT, country TEXT, "
+            "year INTEGER, window_no INTEGER, size INTEGER, mtime_ns INTEGER, token TEXT)"
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS ix_assets_kind ON assets(kind, country, region, year)")
+        c.execute("CREATE INDEX IF NOT EXISTS ix_assets_crop ON assets(kind, crop)")
+        c.commit()
+
+    def _meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @metrics.timed("assets.refresh")
+    def refresh(self, force: bool = False) -> int:
+        """Bring the index up to date; returns the number of added + removed names."""
+        now = time.monotonic()
+        if not force and now - self._checked < MIN_REFRESH_INTERVAL:
+            return 0
+        self._checked = now
+        stamp = self.source.stamp()
+        if stamp is None:
+            return 0
+
+        with self._lock:
+            if not force and self._meta("source_stamp") == stamp and self._tokens:
+                return 0
+            listed = self.source.listing()
+            known = self._tokens
+            added = [n for n, tok in listed.items() if known.get(n) != tok]
+            removed = [n for n in known if n not in listed]
+
+            rows = []
+            for n in added:
+                try:
+                    size, mtime_ns = self.source.stat(n)
+                except OSError:
+                    continue
+                f = parse_name(n)
+                rows.append((n, f["kind"], f["crop"], f["region"], f["country"], f["year"], f["window_no"],
+                             size, mtime_ns, listed[n]))
+            c = self._conn
+            c.executemany("DELETE FROM assets WHERE name = ?", [(n,) for n in removed])
+            c.executemany(f"INSERT OR REPLACE INTO assets VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            c.execute("INSERT OR REPLACE INTO meta VALUES ('source_stamp', ?)", (stamp,))
+            c.commit()
+            self._tokens = listed
+            return len(rows) + len(removed)
+
+    def has(self, name: str) -> bool:
+        """Whether `name` exists in the directory (as of the last refresh)."""
+        self.refresh()
+        return name in self._tokens
+
+    def token(self, name: str) -> str | None:
+        """The change token of `name` (as of the last refresh), or None if it does not exist."""
+        self.refresh()
+        return self._tokens.get(name)
+
+    def info(self, name: str) -> dict | None:
+        """The manifest row for `name` (size, mtime_ns, parsed fields) or None."""
+        if not self.has(name):
+            return None
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM assets WHERE name = ?", (name,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    @metrics.timed("assets.query")
+    def query(self, kind: str | None = None, order_by: str = "name", **filters) -> list:
+        """Rows as dicts, e.g. query("climate", country="BE") or query("season", year=2024)."""
+        self.refresh()
+        where, args = [], []
+        if kind is not None:
+            where.append("kind = ?")
+            args.append(kind)
+        for col, val in filters.items():
+            if col not in COLUMNS:
+                raise ValueError(f"Unknown manifest column: {col}")
+            where.append(f"{col} = ?")
+            args.append(val)
+        if order_by not in COLUMNS:
+            raise ValueError(f"Unknown manifest column: {order_by}")
+        sql = f"SELECT {', '.join(COLUMNS)} FROM assets"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by}"
+        with self._lock:
+            cur = self._conn.execute(sql, args)
+            return [dict(zip(COLUMNS, r)) for r in cur.fetchall()]
+
+    def distinct(self, column: str, kind: str | None = None) -> list:
+        """Sorted non-null values of `column`, optionally within one kind."""
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown manifest column: {column}")
+        self.refresh()
+        sql = f"SELECT DISTINCT {column} FROM assets WHERE {column} IS NOT NULL"
+        args = []
+        if kind is not None:
+            sql += " AND kind = ?"
+            args.append(kind)
+        with self._lock:
+            return sorted(r[0] for r in self._conn.execute(sql, args))
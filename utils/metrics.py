@@ -0,0 +1,347 @@
+# utils/metrics.py
+"""
+In-process timing spans, cache counters and memory gauges.
+
+* `span(name)` / `@timed(name)` time a block or a function into a histogram
+  (count, sum, max, fixed buckets) plus a window of recent durations;
+* `cache_data(...)` / `cache_resource(...)` are drop-in replacements for the
+  Streamlit decorators that also count hits, misses (the body ran) and
+  evictions (a key computed before had to be computed again: it was evicted,
+  expired or cleared);
+* `cache_event(name, event)` counts the same for the hand-rolled LRUs;
+* `gauge(name, fn)` registers a value read at export time (RSS, shared frames).
+
+Everything lives in one registry per process and is exported as Prometheus
+text or JSON lines: over HTTP when EUROAGRI_METRICS_PORT is set
+(GET /metrics, GET /metrics.jsonl), and/or appended to EUROAGRI_METRICS_FILE
+every EUROAGRI_METRICS_INTERVAL seconds. Home.py?diagnostics=1 shows it.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PREFIX = "euroagri"
+
+# Histogram bucket upper bounds (seconds)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Recent durations kept per span for percentiles on the diagnostics page
+RECENT = 256
+
+# Keys remembered per Streamlit cache to tell first computations from recomputations
+SEEN_KEYS = 4096
+
+_lock = threading.Lock()
+_spans: dict = {}
+_caches: dict = {}
+_gauges: dict = {}
+_local = threading.local()
+_exporter: dict = {}
+
+
+# --- Spans ---
+class _Span:
+    __slots__ = ("count", "total", "max", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.recent = deque(maxlen=RECENT)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        s = _spans.get(name)
+        if s is None:
+            s = _spans[name] = _Span()
+        s.observe(seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as `name` (also when it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def deco(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# --- Caches ---
+class _Cache:
+    __slots__ = ("kind", "hits", "misses", "evictions", "seen")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.seen = OrderedDict()
+
+
+def _cache(name: str, kind: str) -> _Cache:
+    c = _caches.get(name)
+    if c is None:
+        c = _caches[name] = _Cache(kind)
+    return c
+
+
+_EVENTS = {"hit": "hits", "miss": "misses", "eviction": "evictions"}
+
+
+def cache_event(name: str, event: str, n: int = 1, kind: str = "lru"):
+    """Count `n` "hit", "miss" or "eviction" events of cache `name`."""
+    field = _EVENTS[event]
+    with _lock:
+        c = _cache(name, kind)
+        setattr(c, field, getattr(c, field) + n)
+
+
+def _key(args, kwargs) -> int:
+    try:
+        return hash((args, tuple(sorted(kwargs.items()))))
+    except TypeError:
+        return hash(repr((args, sorted(kwargs.items()))))
+
+
+def _instrument(decorator, kind: str, kwargs: dict):
+    def deco(func):
+        name = f"{Path(func.__code__.co_filename).stem}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def body(*args, **kw):
+            # Runs only on a miss; tells the innermost call in flight that it computed
+            stack = getattr(_local, "calls", None)
+            if stack:
+                stack[-1] = True
+            key = _key(args, kw)
+            with _lock:
+                c = _cache(name, kind)
+                c.misses += 1
+                if key in c.seen:
+                    c.evictions += 1
+                    c.seen.move_to_end(key)
+                else:
+                    c.seen[key] = None
+                    if len(c.seen) > SEEN_KEYS:
+                        c.seen.popitem(last=False)
+            return func(*args, **kw)
+
+        cached = decorator(**kwargs)(body)
+
+        @functools.wraps(func)
+        def call(*args, **kw):
+            stack = getattr(_local, "calls", None)
+            if stack is None:
+                stack = _local.calls = []
+            stack.append(False)
+            try:
+                return cached(*args, **kw)
+            finally:
+                if not stack.pop():
+                    with _lock:
+                        _cache(name, kind).hits += 1
+
+        call.clear = cached.clear
+        return call
+    return deco
+
+
+def cache_data(**kwargs):
+    """st.cache_data(**kwargs) with hit/miss/eviction counters."""
+    import streamlit as st
+    return _instrument(st.cache_data, "cache_data", kwargs)
+
+
+def cache_resource(**kwargs):
+    """st.cache_resource(**kwargs) with hit/miss/eviction counters."""
+    import streamlit as st
+    return _instrument(st.cache_resource, "cache_resource", kwargs)
+
+
+# --- Gauges ---
+def gauge(name: str, fn, help: str = ""):
+    """Register `fn() -> number | None`, read whenever metrics are exported."""
+    with _lock:
+        _gauges[name] = (fn, help)
+
+
+def _read_gauges() -> dict:
+    with _lock:
+        items = list(_gauges.items())
+    out = {}
+    for name, (fn, help) in items:
+        try:
+            value = fn()
+        except Exception:
+            value = None
+        if value is not None:
+            out[name] = (float(value), help)
+    return out
+
+
+# --- Snapshots and exports ---
+def _pct(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def snapshot() -> dict:
+    """Plain-data copy of every metric: {"spans": [...], "caches": [...], "gauges": [...]}."""
+    with _lock:
+        spans = [
+            {"name": n, "count": s.count, "sum_s": s.total, "max_s": s.max, "buckets": list(s.buckets),
+             "p50_s": _pct(s.recent, 0.5), "p95_s": _pct(s.recent, 0.95)}
+            for n, s in sorted(_spans.items())
+        ]
+        caches = [
+            {"name": n, "kind": c.kind, "hits": c.hits, "misses": c.misses, "evictions": c.evictions}
+            for n, c in sorted(_caches.items())
+        ]
+    gauges = [{"name": n, "value": v, "help": h} for n, (v, h) in sorted(_read_gauges().items())]
+    return {"spans": spans, "caches": caches, "gauges": gauges}
+
+
+def reset():
+    """Zero spans and cache counters (gauges are live values and stay registered)."""
+    with _lock:
+        _spans.clear()
+        _caches.clear()
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(snap: dict | None = None) -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    snap = snap or snapshot()
+    lines = [f"# HELP {PREFIX}_span_seconds Wall-clock time of instrumented hot paths.",
+             f"# TYPE {PREFIX}_span_seconds histogram"]
+    for s in snap["spans"]:
+        lab = f'span="{_label(s["name"])}"'
+        cum = 0
+        for bound, n in zip(BUCKETS, s["buckets"]):
+            cum += n
+            lines.append(f'{PREFIX}_span_seconds_bucket{{{lab},le="{bound}"}} {cum}')
+        lines.append(f'{PREFIX}_span_seconds_bucket{{{lab},le="+Inf"}} {s["count"]}')
+        lines.append(f"{PREFIX}_span_seconds_sum{{{lab}}} {s['sum_s']:.6f}")
+        lines.append(f"{PREFIX}_span_seconds_count{{{lab}}} {s['count']}")
+    lines += [f"# HELP {PREFIX}_span_max_seconds Slowest observation per span since start or reset.",
+              f"# TYPE {PREFIX}_span_max_seconds gauge"]
+    lines += [f'{PREFIX}_span_max_seconds{{span="{_label(s["name"])}"}} {s["max_s"]:.6f}' for s in snap["spans"]]
+    for field, help in (("hits", "Calls answered from the cache."),
+                        ("misses", "Calls that ran the cached function."),
+                        ("evictions", "Recomputations of a key that had been cached before.")):
+        lines += [f"# HELP {PREFIX}_cache_{field}_total {help}", f"# TYPE {PREFIX}_cache_{field}_total counter"]
+        lines += [f'{PREFIX}_cache_{field}_total{{cache="{_label(c["name"])}",kind="{c["kind"]}"}} {c[field]}'
+                  for c in snap["caches"]]
+    for g in snap["gauges"]:
+        if g["help"]:
+            lines.append(f"# HELP {PREFIX}_{g['name']} {g['help']}")
+        lines += [f"# TYPE {PREFIX}_{g['name']} gauge", f"{PREFIX}_{g['name']} {g['value']:g}"]
+    return "\n".join(lines) + "\n"
+
+
+def json_lines(snap: dict | None = None) -> str:
+    """One JSON object per span, cache and gauge, all stamped with the same time."""
+    snap = snap or snapshot()
+    ts = round(time.time(), 3)
+    rows = [{"ts": ts, "pid": os.getpid(), "type": kind[:-1], **{k: v for k, v in row.items() if k != "buckets"}}
+            for kind in ("spans", "caches", "gauges") for row in snap[kind]]
+    return "".join(json.dumps(r) + "\n" for r in rows)
+
+
+# --- Exporter ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = prometheus_text(), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.jsonl":
+            body, ctype = json_lines(), "application/x-ndjson"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _write_loop(path: Path, interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            with open(path, "a", encoding="utf-8") as fh:
+                fh.write(json_lines())
+        except OSError:
+            pass
+
+
+def start_exporter(port: int | None = None, path: Path | None = None, interval: float | None = None) -> dict:
+    """
+    Start the HTTP endpoint and/or the JSON-lines file writer, once per process.
+    Arguments default to EUROAGRI_METRICS_PORT / _HOST / _FILE / _INTERVAL; returns the exporter status.
+    """
+    with _lock:
+        if _exporter:
+            return dict(_exporter)
+        port = port or int(os.environ.get("EUROAGRI_METRICS_PORT", 0) or 0)
+        path = path or os.environ.get("EUROAGRI_METRICS_FILE") or None
+        interval = interval or float(os.environ.get("EUROAGRI_METRICS_INTERVAL", 15))
+        _exporter["started"] = True
+        if port:
+            host = os.environ.get("EUROAGRI_METRICS_HOST", "127.0.0.1")
+            try:
+                server = ThreadingHTTPServer((host, port), _Handler)
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+                _exporter["http"] = f"http://{host}:{port}/metrics"
+            except OSError as e:
+                # Another worker on this host already serves the port
+                _exporter["http_error"] = str(e)
+        if path:
+            threading.Thread(target=_write_loop, args=(Path(path), interval), name="metrics-file",
+                             daemon=True).start()
+            _exporter["file"] = str(path)
+            _exporter["interval_s"] = interval
+        return dict(_exporter)
+
+
+def exporter_status() -> dict:
+    with _lock:
+        return dict(_exporter)
@@ -1,25 +1,170 @@
 # utils/paths.py
 from pathlib import Path
+import os
+import threading
+import time
 
-# Point directly to your WSL path (no copying required)
-DATA_DIR = Path("/mnt/d/Colab/Ecosystem/Deep RL and LLM/Agri/data/processed/kg/crop_app_data")
+from utils.datasource import open_source
+from utils.manifest import Manifest
+
+# Point directly to your WSL path (no copying required); EUROAGRI_DATA_DIR overrides it
+DATA_DIR = Path(os.environ.get(
+    "EUROAGRI_DATA_DIR",
+    "/mnt/d/Colab/Ecosystem/Deep RL and LLM/Agri/data/processed/kg/crop_app_data",
+))
 
 KG_APP_DIR = DATA_DIR
 
+# Optional single-file bundle of DATA_DIR (see utils/assetpack.py); used instead of the
+# loose directory whenever it exists
+PACK_PATH = Path(os.environ.get("EUROAGRI_PACK", str(DATA_DIR.parent / "crop_app_data.eapack")))
+
+# App-generated caches (snapshots, indexes, thumbnails); safe to delete at any time.
+# Point EUROAGRI_CACHE_DIR at a local disk when DATA_DIR is a slow or read-only mount.
+CACHE_DIR = Path(os.environ.get("EUROAGRI_CACHE_DIR", str(DATA_DIR / "_app_cache")))
+SNAPSHOT_DIR = CACHE_DIR / "snapshots"
+THUMB_DIR = CACHE_DIR / "thumbs"
+GRAPH_DIR = CACHE_DIR / "graphs"
+VECTOR_DIR = CACHE_DIR / "vectors"
+LAYOUT_DIR = CACHE_DIR / "layouts"
+CUBE_DIR = CACHE_DIR / "linkcube"
+
+# Hive-partitioned copy of the recommendation presets (see utils/recstore.py)
+REC_STORE_DIR = DATA_DIR / "recommendations_store"
+
+# Re-stat the pack at most this often; a rebuilt, added or removed pack reopens the source
+SOURCE_CHECK_INTERVAL = 2.0
+
+# asset_stamp() reuses a stat while the asset's manifest token is unchanged, for at most this
+# long (in-place rewrites keep the token, so they show up after this delay)
+STAMP_INTERVAL = 30.0
+
+_SOURCE = None
+_SOURCE_KEY = None
+_SOURCE_CHECKED = 0.0
+_MANIFEST = None
+_LOCK = threading.Lock()
+_STAMPS: dict = {}
+
+def _pack_key():
+    try:
+        st = PACK_PATH.stat()
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+def data_source():
+    """The process-wide data source: the asset pack if present, else DATA_DIR."""
+    global _SOURCE, _SOURCE_KEY, _SOURCE_CHECKED
+    with _LOCK:
+        now = time.monotonic()
+        if _SOURCE is None or now - _SOURCE_CHECKED >= SOURCE_CHECK_INTERVAL:
+            _SOURCE_CHECKED = now
+            key = _pack_key()
+            if _SOURCE is None or key != _SOURCE_KEY:
+                # Readers still holding the previous pack keep its mapping alive until they finish
+                _SOURCE = open_source(DATA_DIR, PACK_PATH)
+                _SOURCE_KEY = key
+        return _SOURCE
+
+def manifest() -> Manifest:
+    """The process-wide asset manifest for the data source (see utils/manifest.py)."""
+    global _MANIFEST
+    source = data_source()
+    with _LOCK:
+        if _MANIFEST is None or _MANIFEST.source is not source:
+            if not CACHE_DIR.is_relative_to(DATA_DIR):
+                # An explicit EUROAGRI_CACHE_DIR may need its parents created; the default one
+                # lives inside DATA_DIR and must not recreate a missing mount
+                try:
+                    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                except OSError:
+                    pass
+            _MANIFEST = Manifest(source, CACHE_DIR / "assets.sqlite")
+        return _MANIFEST
+
+def in_data_dir(path: Path) -> bool:
+    """Whether `path` names an asset of the data source (a direct child of DATA_DIR)."""
+    return Path(path).parent == DATA_DIR
+
+def asset_exists(path: Path) -> bool:
+    """Existence check that hits the manifest instead of the filesystem for DATA_DIR files."""
+    path = Path(path)
+    if in_data_dir(path):
+        return manifest().has(path.name)
+    return path.exists()
+
+def asset_stat(path: Path):
+    """
+    (size, mtime_ns) of an asset, or None if it does not exist. Always a real stat
+    (or the pack's index): this keys caches, and the manifest misses in-place rewrites.
+    """
+    path = Path(path)
+    if in_data_dir(path):
+        try:
+            return tuple(data_source().stat(path.name))
+        except (OSError, KeyError):
+            return None
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def asset_stamp(path: Path):
+    """
+    asset_stat() for paths asked for on every rerun (thumbnails): a DATA_DIR asset is only
+    re-stat'ed when its manifest token moved or its last stat is STAMP_INTERVAL old.
+    """
+    path = Path(path)
+    if not in_data_dir(path):
+        return asset_stat(path)
+    token = manifest().token(path.name)
+    if token is None:
+        _STAMPS.pop(path.name, None)
+        return None
+    now = time.monotonic()
+    hit = _STAMPS.get(path.name)
+    if hit is not None and hit[0] == token and now - hit[1] < STAMP_INTERVAL:
+        return hit[2]
+    stamp = asset_stat(path)
+    _STAMPS[path.name] = (token, now, stamp)
+    return stamp
+
+def open_asset(path: Path):
+    """Binary file object for an asset, wherever it lives."""
+    path = Path(path)
+    return data_source().open(path.name) if in_data_dir(path) else open(path, "rb")
+
+def read_asset(path: Path) -> bytes:
+    path = Path(path)
+    return data_source().read(path.name) if in_data_dir(path) else path.read_bytes()
+
+def image_input(path: Path):
+    """Argument for st.image: a path string for loose files, bytes for packed ones."""
+    path = Path(path)
+    return data_source().image_input(path.name) if in_data_dir(path) else str(path)
+
+def arrow_input(path: Path):
+    """Argument for pyarrow readers: a path string, or a zero-copy buffer reader into the pack."""
+    path = Path(path)
+    return data_source().arrow_input(path.name) if in_data_dir(path) else str(path)
+
+def watch_path(path: Path) -> Path:
+    """The file whose fingerprint changes when `path` changes (the pack itself when packed)."""
+    path = Path(path)
+    return data_source().watch_path(path.name) if in_data_dir(path) else path
+
 def crops_available():
     """
     Discover crops by looking for the matrix images you already export:
     subgraph_crop_{crop}_matrix.png
     """
-    if not DATA_DIR.exists():
-        return []
-    items = []
-    for p in DATA_DIR.glob("subgraph_crop_*_matrix.png"):
-        # e.g., subgraph_crop_wheat_matrix.png -> wheat
-        name = p.stem.replace("subgraph_crop_", "").replace("_matrix", "")
-        if name:
-            items.append(name)
-    return sorted(set(items))
+    return manifest().distinct("crop", kind="crop_matrix")
+
+def graph_crops():
+    """Crops with a graph_crop_{crop}.graphml export."""
+    return manifest().distinct("crop", kind="graphml")
 
 def png(pathname: str) -> Path:
     """Convenience to return a Path inside DATA_DIR."""
@@ -28,7 +173,7 @@ def png(pathname: str) -> Path:
 def crop_pngs(crop: str):
     """
     Return all known PNG variants for a given crop.
-    Some files might not exist; callers should check .exists().
+    Some files might not exist; callers should check asset_exists().
     """
     crop = str(crop).lower().strip()
     return {
@@ -38,15 +183,17 @@ def crop_pngs(crop: str):
         "climate_matrix":   png(f"subgraph_crop_{crop}_climate_matrix.png"),
         "disease":          png(f"subgraph_crop_{crop}_disease.png"),
         "disease_matrix":   png(f"subgraph_crop_{crop}_disease_matrix.png"),
-        "graphml":          png(f"graph_crop_{crop}.graphml"),  # not displayed on pages 2–3
+        "graphml":          graphml(crop),  # compiled by utils/graph.py, not displayed as an image
     }
 
+def graphml(crop: str) -> Path:
+    """Return the per-crop knowledge-graph export Path."""
+    return png(f"graph_crop_{str(crop).lower().strip()}.graphml")
+
 def schema_png():
     """Return the schema metagraph image Path."""
     return png("schema_metagraph.png")
 
 def season_examples():
     """Return a sorted list of any available seasonal subgraph images."""
-    if not DATA_DIR.exists():
-        return []
-    return sorted(DATA_DIR.glob("subgraph_season_*_*.png"))
\ No newline at end of file
+    return [DATA_DIR / r["name"] for r in manifest().query("season")]
\ No newline at end of file
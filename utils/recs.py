@@ -0,0 +1,401 @@
+# utils/recs.py
+"""
+Query layer for the recommendation tables.
+
+The widget selections on Home.py are turned into a pyarrow dataset filter, so
+parquet row groups whose statistics cannot match are skipped and only the
+requested columns are ever decoded.
+"""
+import json
+import os
+import threading
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils import metrics
+from utils.paths import arrow_input, asset_stat
+
+# Preset name -> parquet filename under DATA_DIR (as exported by the pipeline)
+PRESETS = {
+    "default": "recommendations.parquet",
+    "balanced": "recommendations_balanced.parquet",
+    "low_water": "recommendations_low_water.parquet",
+    "low_n": "recommendations_low_n.parquet",
+    "disease_aware": "recommendations_disease_aware.parquet",
+    "robust": "recommendations_robust.parquet",
+}
+
+# Columns shown in the Home table (only those that exist are read)
+PREFERRED_COLS = [
+    "region_iso", "crop", "variety", "year",
+    "plan_score", "variety_fit", "disease_fit",
+    "irr_total_mm", "etc_total_mm", "pe_total_mm", "rainfall_share",
+    "n_kg_ha", "p_kg_ha", "k_kg_ha", "net_irrig_mm_sel",
+    "robust_score", "rank_plan", "__source__"
+]
+
+# Columns that "Only show rows without NaNs" applies to
+KEY_COLS = ["plan_score", "disease_fit", "variety_fit"]
+
+# Columns the selector widgets are built from
+SELECTOR_COLS = ["crop", "region_iso", "year"]
+
+# String keys held as pandas categoricals in the shared in-memory frames
+CATEGORY_COLS = ["region_iso", "crop", "variety", "__source__"]
+
+# Sortable columns -> True if smaller is better (rank 1 is the best plan)
+SORT_KEYS = {"plan_score": False, "robust_score": False, "rank_plan": True}
+
+# Sidecar with precomputed selector values, written next to recommendations_meta.json
+DICTS_NAME = "recommendations_dicts.json"
+
+# Serialises the sidecar's read-merge-write within a process
+_DICTS_LOCK = threading.Lock()
+
+
+def preset_files(base: Path) -> dict:
+    """Map every preset name to its parquet Path under `base`."""
+    return {k: Path(base) / name for k, name in PRESETS.items()}
+
+
+def open_dataset(source) -> ds.Dataset:
+    """
+    Open a parquet file (or list of files) as a dataset; datasets pass through.
+    Files inside an asset pack are read in place from the mapped buffer.
+    """
+    if isinstance(source, ds.Dataset):
+        return source
+    if isinstance(source, (list, tuple)):
+        return ds.dataset([str(s) for s in source], format="parquet")
+    src = arrow_input(source)
+    if isinstance(src, str):
+        return ds.dataset(src, format="parquet")
+    fmt = ds.ParquetFileFormat()
+    fragment = fmt.make_fragment(src)
+    return ds.FileSystemDataset([fragment], schema=fragment.physical_schema, format=fmt,
+                                filesystem=fragment.filesystem)
+
+
+def _missing(field: ds.Expression, typ: pa.DataType) -> ds.Expression:
+    """True where a value is null (or NaN for float columns), like pandas' isna()."""
+    expr = field.is_null()
+    if pa.types.is_floating(typ):
+        expr = expr | pc.is_nan(field)
+    return expr
+
+
+def build_filter(schema: pa.Schema, crop=None, region=None, years=None,
+                 min_score=None, drop_na=()) -> ds.Expression | None:
+    """
+    Translate the Home.py selections into a dataset expression.
+
+    Mirrors the pandas mask it replaces: filters only apply to columns that
+    exist, an empty year list means "all years", and a missing plan_score
+    counts as 0 against the min_score threshold.
+    """
+    names = set(schema.names)
+    parts = []
+    if crop and "crop" in names:
+        parts.append(ds.field("crop") == crop)
+    if region and "region_iso" in names:
+        parts.append(ds.field("region_iso") == region)
+    if years and "year" in names:
+        typ = schema.field("year").type
+        if pa.types.is_dictionary(typ):
+            typ = typ.value_type
+        parts.append(ds.field("year").isin(pa.array(list(years)).cast(typ)))
+    if min_score is not None and "plan_score" in names:
+        f = ds.field("plan_score")
+        typ = schema.field("plan_score").type
+        # Compare in the column's own precision: a float32 0.70 must pass a 0.70 threshold
+        expr = f >= (pa.scalar(float(min_score), type=typ) if pa.types.is_floating(typ) else float(min_score))
+        if float(min_score) <= 0:
+            expr = expr | _missing(f, typ)
+        parts.append(expr)
+    for c in drop_na:
+        if c in names:
+            parts.append(~_missing(ds.field(c), schema.field(c).type))
+
+    if not parts:
+        return None
+    expr = parts[0]
+    for p in parts[1:]:
+        expr = expr & p
+    return expr
+
+
+@metrics.timed("filter.mask")
+def frame_mask(df: pd.DataFrame, crop=None, region=None, years=None, min_score=None,
+               drop_na=(), score=None) -> np.ndarray:
+    """
+    In-memory equivalent of build_filter() for frames already loaded.
+    `score` overrides the plan_score column (used by custom presets).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if crop and "crop" in df:
+        mask &= (df["crop"] == crop).to_numpy()
+    if region and "region_iso" in df:
+        mask &= (df["region_iso"] == region).to_numpy()
+    if years and "year" in df:
+        mask &= df["year"].isin(list(years)).to_numpy()
+    if score is None and "plan_score" in df:
+        dtype = np.float32 if df["plan_score"].dtype == np.float32 else np.float64
+        score = df["plan_score"].to_numpy(dtype=dtype, na_value=np.nan)
+    if min_score is not None and score is not None:
+        # Same precision rule as build_filter(): threshold rounded like the scores
+        mask &= np.nan_to_num(score, nan=0.0) >= score.dtype.type(min_score)
+    for c in drop_na:
+        if c == "plan_score" and score is not None:
+            mask &= ~np.isnan(score)
+        elif c in df:
+            mask &= df[c].notna().to_numpy()
+    return mask
+
+
+@metrics.timed("filter.pushdown")
+def query(source, columns=None, crop=None, region=None, years=None,
+          min_score=None, drop_na=()) -> pd.DataFrame:
+    """
+    Read only the rows and columns matching the selection.
+
+    `columns` is a wish list; names missing from the file are ignored.
+    `drop_na` lists columns that must be non-null in every returned row.
+    """
+    dataset = open_dataset(source)
+    schema = dataset.schema
+    cols = [c for c in (columns or schema.names) if c in schema.names]
+    expr = build_filter(schema, crop=crop, region=region, years=years,
+                        min_score=min_score, drop_na=drop_na)
+    table = dataset.to_table(columns=cols, filter=expr)
+    return table.to_pandas()
+
+
+def distinct_values(source, columns=SELECTOR_COLS) -> dict:
+    """Sorted non-null distinct values per column, reading only those columns."""
+    dataset = open_dataset(source)
+    cols = [c for c in columns if c in dataset.schema.names]
+    out = {c: [] for c in columns}
+    if not cols:
+        return out
+    table = dataset.to_table(columns=cols)
+    for c in cols:
+        col = table.column(c)
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        out[c] = sorted(pc.unique(col.drop_null()).to_pylist())
+    return out
+
+
+def source_stamp(path: Path) -> list:
+    """Cheap change detector for a preset file: [mtime_ns, size]."""
+    stat = asset_stat(path)
+    if stat is None:
+        raise FileNotFoundError(path)
+    size, mtime_ns = stat
+    return [mtime_ns, size]
+
+
+def _zonemap_values(zonemap: pd.DataFrame, preset: str, columns) -> dict:
+    zm = zonemap[zonemap["preset"] == preset]
+    return {c: sorted(zm[c].dropna().unique().tolist()) if c in zm else [] for c in columns}
+
+
+@metrics.timed("load.selectors")
+def preset_dictionary(preset: str, path: Path, sidecar: Path, zonemap: pd.DataFrame | None = None,
+                      columns=SELECTOR_COLS) -> dict:
+    """
+    Selector values for one preset, served from the sidecar when it is current.
+
+    Only this preset's entry is recomputed when its parquet changed: from the
+    partitioned store's zone map if available (no data read at all), else by
+    scanning just the selector columns. This entry is then merged into a fresh
+    read of the sidecar and written atomically; a read-only data directory
+    simply means no persistence.
+    """
+    sidecar = Path(sidecar)
+    stamp = source_stamp(path)
+    entry = _read_dicts(sidecar).get("presets", {}).get(preset)
+    if entry and entry.get("source") == stamp and all(c in entry for c in columns):
+        return {c: entry[c] for c in columns}
+
+    if zonemap is not None and not zonemap.empty and (zonemap["preset"] == preset).any():
+        values = _zonemap_values(zonemap, preset, columns)
+    else:
+        values = distinct_values(path, columns)
+
+    with _DICTS_LOCK:
+        # Re-read under the lock so entries other presets wrote meanwhile are kept
+        data = _read_dicts(sidecar)
+        data.setdefault("presets", {})[preset] = {"source": stamp, **values}
+        tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_text(json.dumps(data, indent=2))
+            os.replace(tmp, sidecar)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    return values
+
+
+def _read_dicts(sidecar: Path) -> dict:
+    try:
+        return json.loads(sidecar.read_text()) if sidecar.exists() else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def page_indices(keys: np.ndarray, page: int, page_size: int) -> np.ndarray:
+    """
+    Positions of rows `page*page_size ... +page_size` in ascending `keys` order.
+
+    Equivalent to `np.argsort(keys, kind="stable")[lo:hi]` but O(n + k log k):
+    the two boundary values are found with a partition, and only rows between
+    them are sorted. Ties are broken by row position, so consecutive pages
+    never repeat or skip a row.
+    """
+    n = len(keys)
+    lo = page * page_size
+    hi = min(lo + page_size, n)
+    if lo >= n or page_size <= 0:
+        return np.empty(0, dtype=np.intp)
+    bounds = np.partition(keys, [lo, hi - 1])
+    v_lo, v_hi = bounds[lo], bounds[hi - 1]
+    n_before = int(np.count_nonzero(keys < v_lo))
+    cand = np.flatnonzero((keys >= v_lo) & (keys <= v_hi))
+    cand = cand[np.argsort(keys[cand], kind="stable")]
+    start = lo - n_before
+    return cand[start:start + (hi - lo)]
+
+
+class RankIndex:
+    """
+    Sort keys for one result frame, built lazily per (column, direction).
+
+    Keys are float64 with missing values mapped to +inf, so NaNs always sort
+    last whichever direction is chosen.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._keys = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def keys(self, col: str, ascending: bool) -> np.ndarray:
+        k = (col, ascending)
+        if k not in self._keys:
+            v = pd.to_numeric(self.df[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            key = v.copy() if ascending else -v
+            key[np.isnan(key)] = np.inf
+            self._keys[k] = key
+        return self._keys[k]
+
+    @metrics.timed("sort.page")
+    def page(self, col: str, ascending: bool, page: int, page_size: int) -> pd.DataFrame:
+        """One page of the frame ordered by `col`; unsorted slice if `col` is absent."""
+        if col not in self.df.columns:
+            return self.df.iloc[page * page_size:(page + 1) * page_size]
+        idx = page_indices(self.keys(col, ascending), page, page_size)
+        return self.df.iloc[idx]
+
+
+# ---------------------------------------------------------------------------
+# Compact shared frames
+# ---------------------------------------------------------------------------
+# Weak references: an entry disappears once its cache entry is evicted and no session uses it
+_SHARED = weakref.WeakValueDictionary()
+_SHARED_LOCK = threading.Lock()
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a recommendation frame: key strings become categoricals, floats
+    become float32 and integers are downcast. Values are unchanged apart
+    from float32 rounding.
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            pass
+        elif c in CATEGORY_COLS or (s.dtype == object and s.nunique(dropna=True) <= len(s) // 2):
+            s = s.astype("category")
+        elif pd.api.types.is_float_dtype(s.dtype) and s.dtype != np.float32:
+            s = s.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(s.dtype) and isinstance(s.dtype, np.dtype):
+            s = pd.to_numeric(s, downcast="integer")
+        out[c] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+@metrics.timed("load.parquet")
+def load_compact(path: Path, source: str) -> pd.DataFrame:
+    """Read a preset parquet with its key columns dictionary-decoded straight into categoricals."""
+    schema = pq.read_schema(arrow_input(path))
+    keys = [c for c in CATEGORY_COLS if c in schema.names]
+    df = pq.read_table(arrow_input(path), read_dictionary=keys).to_pandas()
+    df["__source__"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[source])
+    return compact(df)
+
+
+def concat_compact(frames: list) -> pd.DataFrame:
+    """Concatenate compact frames without categoricals falling back to object strings."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    cat_cols = {c for f in frames for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)}
+    dtypes = {}
+    for c in cat_cols:
+        cats = pd.Index([])
+        for f in frames:
+            if c in f.columns:
+                cats = cats.union(f[c].astype("category").cat.categories)
+        dtypes[c] = pd.CategoricalDtype(cats)
+    frames = [f.astype({c: t for c, t in dtypes.items() if c in f.columns}) for f in frames]
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def register_shared(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Record a process-wide frame so its footprint can be reported; returns `df`."""
+    with _SHARED_LOCK:
+        _SHARED[name] = df
+    return df
+
+
+def memory_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def shared_bytes() -> int:
+    """In-memory size of all registered shared frames."""
+    with _SHARED_LOCK:
+        frames = list(_SHARED.values())
+    return sum(memory_bytes(df) for df in frames)
+
+
+def process_rss() -> int | None:
+    """Resident set size of this process in bytes (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def shared_footprint() -> pd.DataFrame:
+    """Rows and in-memory size of every registered shared frame."""
+    with _SHARED_LOCK:
+        items = list(_SHARED.items())
+    rows = [{"frame": k, "rows": len(df), "MB": memory_bytes(df) / 2**20} for k, df in items]
+    return pd.DataFrame(rows, columns=["frame", "rows", "MB"])
+
+
+metrics.gauge("process_rss_bytes", process_rss, "Resident set size of the app process.")
+metrics.gauge("shared_frames_bytes", shared_bytes, "In-memory size of the process-wide recommendation frames.")
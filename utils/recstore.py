@@ -0,0 +1,238 @@
+# utils/recstore.py
+"""
+Hive-partitioned recommendation store with a zone-map index.
+
+`python -m utils.recstore build` rewrites the monolithic preset parquets into
+
+    recommendations_store/preset=<p>/crop=<c>/region_iso=<r>/year=<y>/part-0.parquet
+
+and writes `_zonemap.parquet`: one row per data file with its partition keys,
+row count and min/max of plan_score and robust_score. Readers consult the zone
+map first and only open files that can contain matching rows.
+"""
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.paths import DATA_DIR, REC_STORE_DIR, arrow_input, asset_exists
+from utils import metrics, recs
+
+PARTITION_COLS = ["preset", "crop", "region_iso", "year"]
+STAT_COLS = ["plan_score", "robust_score"]
+ZONEMAP_NAME = "_zonemap.parquet"
+SOURCES_NAME = "_sources.json"
+
+# Files held open at once while writing; input is sorted by partition key, so each
+# partition is written contiguously and closing a file never splits it
+MAX_OPEN_FILES = 512
+
+
+def _plain(field: pa.Field) -> pa.Field:
+    """Partition keys are stored in paths, so dictionary columns become their value type."""
+    if pa.types.is_dictionary(field.type):
+        return pa.field(field.name, field.type.value_type)
+    return field
+
+
+def _partitioning(schema: pa.Schema) -> ds.Partitioning:
+    """Hive partitioning with explicit key types (no inference from directory names)."""
+    fields = [pa.field("preset", pa.string())]
+    fields += [_plain(schema.field(c)) for c in PARTITION_COLS[1:] if c in schema.names]
+    return ds.partitioning(pa.schema(fields), flavor="hive")
+
+
+def _zone_rows(preset_dir: Path, store_dir: Path, partitioning: ds.Partitioning) -> pd.DataFrame:
+    """Scan the freshly written files of one preset and compute their zone-map entries."""
+    dataset = ds.dataset(str(preset_dir), format="parquet", partitioning=partitioning,
+                         partition_base_dir=str(store_dir))
+    rows = []
+    for frag in dataset.get_fragments():
+        entry = dict(ds.get_partition_keys(frag.partition_expression))
+        entry["path"] = Path(frag.path).relative_to(store_dir).as_posix()
+        names = frag.physical_schema.names
+        table = frag.to_table(columns=[c for c in STAT_COLS if c in names])
+        entry["rows"] = frag.count_rows()
+        for c in STAT_COLS:
+            lo = hi = None
+            if c in table.column_names:
+                col = table.column(c)
+                if pa.types.is_floating(col.type):
+                    col = pc.if_else(pc.is_nan(col), pa.scalar(None, col.type), col)
+                mm = pc.min_max(col)
+                lo, hi = mm["min"].as_py(), mm["max"].as_py()
+            entry[f"{c}_min"], entry[f"{c}_max"] = lo, hi
+        rows.append(entry)
+    return pd.DataFrame(rows)
+
+
+def build(files: dict, store_dir: Path = REC_STORE_DIR, presets=None, force: bool = False) -> list:
+    """
+    (Re)write the partitioned store for the given presets.
+
+    Presets whose source parquet is unchanged since the last build are skipped
+    unless `force` is set. Returns the list of presets that were rewritten.
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    sources_path = store_dir / SOURCES_NAME
+    sources = json.loads(sources_path.read_text()) if sources_path.exists() else {}
+    zonemap = read_zonemap(store_dir)
+
+    rebuilt, retired = [], []
+    for preset in presets or list(files):
+        src = Path(files[preset])
+        if not asset_exists(src):
+            continue
+        stamp = recs.source_stamp(src)
+        if not force and sources.get(preset) == stamp and (store_dir / f"preset={preset}").exists():
+            continue
+
+        table = pq.read_table(arrow_input(src))
+        partitioning = _partitioning(table.schema)
+        key_fields = [f for f in partitioning.schema if f.name != "preset"]
+        for f in key_fields:
+            i = table.schema.get_field_index(f.name)
+            table = table.set_column(i, f, table.column(i).cast(f.type))
+        keys = [f.name for f in key_fields]
+        n_parts = table.group_by(keys).aggregate([]).num_rows if keys else 1
+        if keys:
+            table = table.sort_by([(k, "ascending") for k in keys])
+
+        # Write next to the live copy, then swap it in so readers never see half a preset
+        tmp_dir = store_dir / f".tmp-preset={preset}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        ds.write_dataset(
+            table, str(tmp_dir), format="parquet",
+            partitioning=ds.partitioning(pa.schema(key_fields), flavor="hive") if key_fields else None,
+            basename_template="part-{i}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=max(n_parts, 1024),
+            max_open_files=min(max(n_parts, 1), MAX_OPEN_FILES),
+        )
+        # Move the live copy aside rather than deleting it: readers still holding the
+        # previous zone map keep finding their files until the new one is published
+        live_dir = store_dir / f"preset={preset}"
+        old_dir = store_dir / f".old-preset={preset}.{os.getpid()}"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if live_dir.exists():
+            os.replace(live_dir, old_dir)
+            retired.append(old_dir)
+        os.replace(tmp_dir, live_dir)
+
+        rows = _zone_rows(live_dir, store_dir, partitioning)
+        if not zonemap.empty:
+            zonemap = zonemap[zonemap["preset"] != preset]
+        zonemap = pd.concat([zonemap, rows], ignore_index=True) if not zonemap.empty else rows
+        sources[preset] = stamp
+        rebuilt.append(preset)
+
+    if rebuilt:
+        # Sources first: readers key their caches on the zonemap, so once it is published
+        # the matching _sources.json must already be complete
+        tmp = store_dir / f".{SOURCES_NAME}.tmp"
+        tmp.write_text(json.dumps(sources, indent=2))
+        os.replace(tmp, sources_path)
+        tmp = store_dir / f".{ZONEMAP_NAME}.tmp"
+        zonemap.to_parquet(tmp, index=False)
+        os.replace(tmp, store_dir / ZONEMAP_NAME)
+    for old_dir in retired:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return rebuilt
+
+
+def read_zonemap(store_dir: Path = REC_STORE_DIR) -> pd.DataFrame:
+    """The zone map as a small DataFrame (empty if the store was never built)."""
+    p = Path(store_dir) / ZONEMAP_NAME
+    if not p.exists():
+        return pd.DataFrame()
+    return pd.read_parquet(p)
+
+
+def read_sources(store_dir: Path = REC_STORE_DIR) -> dict:
+    """Source stamps ([mtime_ns, size]) of the preset parquets each partition set was built from."""
+    p = Path(store_dir) / SOURCES_NAME
+    return json.loads(p.read_text()) if p.exists() else {}
+
+
+def has_preset(zonemap: pd.DataFrame, preset: str) -> bool:
+    return not zonemap.empty and bool((zonemap["preset"] == preset).any())
+
+
+def fresh_presets(zonemap: pd.DataFrame, sources: dict, files: dict) -> list:
+    """Presets whose partitions were built from the parquet currently on disk."""
+    return [k for k, p in files.items()
+            if asset_exists(p) and has_preset(zonemap, k) and sources.get(k) == recs.source_stamp(p)]
+
+
+def select_files(zonemap: pd.DataFrame, preset: str, crop=None, region=None,
+                 years=None, min_score=None) -> list:
+    """
+    Relative paths of the data files that can hold matching rows.
+
+    Partitions are pruned on their keys, and on plan_score_max when the
+    threshold is positive (a missing plan_score counts as 0, so nothing can
+    be pruned at or below zero).
+    """
+    zm = zonemap[zonemap["preset"] == preset]
+    if crop and "crop" in zm:
+        zm = zm[zm["crop"] == crop]
+    if region and "region_iso" in zm:
+        zm = zm[zm["region_iso"] == region]
+    if years and "year" in zm:
+        zm = zm[zm["year"].isin(list(years))]
+    if min_score is not None and float(min_score) > 0:
+        # Float32 partitions compare against float32(min_score), which may round down: prune below both
+        zm = zm[zm["plan_score_max"] >= min(float(min_score), float(np.float32(min_score)))]
+    return zm["path"].tolist()
+
+
+@metrics.timed("filter.store")
+def query(zonemap: pd.DataFrame, preset: str, store_dir: Path = REC_STORE_DIR, columns=None,
+          crop=None, region=None, years=None, min_score=None, drop_na=()) -> pd.DataFrame:
+    """Like recs.query(), but opens only the partitions the zone map lets through."""
+    store_dir = Path(store_dir)
+    paths = select_files(zonemap, preset, crop=crop, region=region, years=years, min_score=min_score)
+    if not paths:
+        return pd.DataFrame(columns=[c for c in (columns or []) if c != "preset"])
+
+    zm_schema = pa.Schema.from_pandas(zonemap, preserve_index=False)
+    fields = [pa.field("preset", pa.string())]
+    fields += [zm_schema.field(c) for c in PARTITION_COLS[1:] if c in zm_schema.names]
+    dataset = ds.dataset([str(store_dir / p) for p in paths], format="parquet",
+                         partitioning=ds.partitioning(pa.schema(fields), flavor="hive"),
+                         partition_base_dir=str(store_dir))
+    return recs.query(dataset, columns=columns, crop=crop, region=region, years=years,
+                      min_score=min_score, drop_na=drop_na)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the partitioned recommendation store.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="rewrite preset parquets into the hive-partitioned store")
+    b.add_argument("--preset", action="append", choices=sorted(recs.PRESETS),
+                   help="only rebuild this preset (repeatable)")
+    b.add_argument("--force", action="store_true", help="rebuild even if the source is unchanged")
+    b.add_argument("--out", type=Path, default=REC_STORE_DIR, help="store directory")
+    args = parser.parse_args(argv)
+
+    files = recs.preset_files(DATA_DIR)
+    rebuilt = build(files, store_dir=args.out, presets=args.preset, force=args.force)
+    print(f"Rebuilt: {', '.join(rebuilt) if rebuilt else 'nothing (store up to date)'}")
+
+    # Refresh the selector dictionaries straight from the new zone map
+    zonemap = read_zonemap(args.out)
+    for preset in rebuilt:
+        recs.preset_dictionary(preset, files[preset], DATA_DIR / recs.DICTS_NAME, zonemap=zonemap)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# utils/rescoring.py
+"""
+Custom objective presets: re-score a whole recommendation table in NumPy.
+
+The feature columns are min-max normalised once per table (cost columns such
+as irrigation and N/P/K are flipped so that 1 is always best). A weight vector
+then costs one matrix-vector product for plan_score and one argsort for
+rank_plan within each (region_iso, crop, year) group. Results are memoised
+per weight vector in a small LRU.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+
+# Feature column -> True if a higher value is better
+FEATURES = {
+    "variety_fit": True,
+    "disease_fit": True,
+    "rainfall_share": True,
+    "irr_total_mm": False,
+    "n_kg_ha": False,
+    "p_kg_ha": False,
+    "k_kg_ha": False,
+}
+
+# rank_plan is recomputed within these groups (rank 1 = best plan)
+GROUP_COLS = ["region_iso", "crop", "year"]
+
+
+class Rescorer:
+    """
+    Precomputed normalised features for one table plus an LRU of scorings.
+
+    A missing feature value earns no credit for that feature. Thread-safe, so
+    one instance can be shared by every session through st.cache_resource.
+    """
+
+    def __init__(self, df: pd.DataFrame, cache_size: int = 8):
+        self.n = len(df)
+        self.features = [c for c in FEATURES if c in df.columns]
+        x = np.zeros((self.n, len(self.features)), dtype=np.float32)
+        for j, c in enumerate(self.features):
+            v = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
+            lo, hi = np.nanmin(v) if self.n else 0.0, np.nanmax(v) if self.n else 0.0
+            span = hi - lo if np.isfinite(hi - lo) and hi > lo else 1.0
+            col = (v - lo) / span
+            if not FEATURES[c]:
+                col = 1.0 - col
+            x[:, j] = np.nan_to_num(col, nan=0.0)
+        self.x = x
+
+        groups = [c for c in GROUP_COLS if c in df.columns]
+        if groups and self.n:
+            self.group = df.groupby(groups, sort=False, observed=True, dropna=False).ngroup().to_numpy(np.int64)
+        else:
+            self.group = np.zeros(self.n, dtype=np.int64)
+        counts = np.bincount(self.group) if self.n else np.zeros(0, dtype=np.int64)
+        self.group_start = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def _key(self, weights: dict) -> tuple:
+        return tuple(round(float(weights.get(c, 0.0)), 4) for c in self.features)
+
+    def _compute(self, key: tuple):
+        w = np.asarray(key, dtype=np.float32)
+        total = float(np.abs(w).sum())
+        score = self.x @ (w / total) if total > 0 else np.zeros(self.n, dtype=np.float32)
+
+        # One argsort: group id plus a [0, 0.5] offset that is smaller for better scores
+        order = np.argsort(self.group + (1.0 - score.astype(np.float64)) * 0.5, kind="stable")
+        rank = np.empty(self.n, dtype=np.int32)
+        rank[order] = np.arange(self.n) - self.group_start[self.group[order]] + 1
+        return score.astype(np.float32), rank
+
+    def score(self, weights: dict):
+        """(plan_score, rank_plan) arrays aligned with the source frame's rows."""
+        key = self._key(weights)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                metrics.cache_event("rescoring.score", "hit")
+                return self._cache[key]
+        metrics.cache_event("rescoring.score", "miss")
+        with metrics.span("filter.rescore"):
+            result = self._compute(key)
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+                metrics.cache_event("rescoring.score", "eviction")
+        return result
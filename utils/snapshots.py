@@ -0,0 +1,159 @@
+# utils/snapshots.py
+"""
+Uncompressed Arrow IPC snapshots of the recommendation presets.
+
+Each preset parquet is converted once into `_app_cache/snapshots/<name>.arrow`
+(already compact: dictionary-encoded keys, float32 metrics). Every app worker
+then memory-maps the same file, so the OS page cache holds a single copy of
+the data however many processes are running, and no worker decodes parquet.
+
+    python -m utils.snapshots          # convert all stale presets up front
+"""
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.paths import DATA_DIR, SNAPSHOT_DIR, arrow_input, asset_exists
+from utils import metrics, recs
+
+# Schema metadata key holding the [mtime_ns, size] of the source parquet
+STAMP_KEY = b"euroagri.source_stamp"
+
+# One conversion at a time per snapshot within a process
+_locks: dict = {}
+_locks_lock = threading.Lock()
+
+
+def snapshot_path(src: Path, snapshot_dir: Path = SNAPSHOT_DIR) -> Path:
+    return Path(snapshot_dir) / f"{Path(src).stem}.arrow"
+
+
+def compact_table(table: pa.Table) -> pa.Table:
+    """
+    Arrow-side twin of recs.compact(): key and low-cardinality strings are
+    dictionary-encoded, floats become float32 with nulls stored as NaN (so
+    pandas can view them without a copy), integers are narrowed to fit.
+    """
+    cols = []
+    for name, col in zip(table.column_names, table.columns):
+        typ = col.type
+        if pa.types.is_string(typ) or pa.types.is_large_string(typ):
+            if name in recs.CATEGORY_COLS or pc.count_distinct(col).as_py() <= len(col) // 2:
+                col = pc.dictionary_encode(col.cast(pa.string()))
+        elif pa.types.is_floating(typ):
+            col = pc.fill_null(col.cast(pa.float32()), float("nan"))
+        elif pa.types.is_integer(typ) and col.null_count == 0 and len(col):
+            mm = pc.min_max(col)
+            lo, hi = mm["min"].as_py(), mm["max"].as_py()
+            for t in (pa.int8(), pa.int16(), pa.int32()):
+                bits = t.bit_width - 1
+                if -(2 ** bits) <= lo and hi < 2 ** bits:
+                    col = col.cast(t)
+                    break
+        cols.append(col)
+    return pa.table(cols, names=table.column_names)
+
+
+def _read_stamp(path: Path):
+    try:
+        with pa.memory_map(str(path), "r") as source:
+            meta = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    raw = meta.get(STAMP_KEY)
+    return json.loads(raw) if raw else None
+
+
+def is_fresh(src: Path, snapshot_dir: Path = SNAPSHOT_DIR) -> bool:
+    snap = snapshot_path(src, snapshot_dir)
+    return snap.exists() and _read_stamp(snap) == recs.source_stamp(src)
+
+
+@metrics.timed("load.snapshot_convert")
+def convert(src: Path, snapshot_dir: Path = SNAPSHOT_DIR) -> Path:
+    """Write the snapshot for `src` and swap it in atomically; returns its Path."""
+    src = Path(src)
+    snap = snapshot_path(src, snapshot_dir)
+    snap.parent.mkdir(parents=True, exist_ok=True)
+
+    schema = pq.read_schema(arrow_input(src))
+    keys = [c for c in recs.CATEGORY_COLS if c in schema.names]
+    table = compact_table(pq.read_table(arrow_input(src), read_dictionary=keys)).unify_dictionaries()
+    meta = dict(table.schema.metadata or {})
+    meta[STAMP_KEY] = json.dumps(recs.source_stamp(src)).encode()
+    table = table.replace_schema_metadata(meta)
+
+    # Unique temp name per process and thread: concurrent writers never share a file, the last replace wins
+    tmp = snap.with_name(f".{snap.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, snap)
+    return snap
+
+
+def ensure(src: Path, snapshot_dir: Path = SNAPSHOT_DIR) -> Path | None:
+    """
+    Path of an up-to-date snapshot for `src`, converting it if needed.
+    Returns None if the cache directory is not writable (callers read the parquet).
+    """
+    snap = snapshot_path(src, snapshot_dir)
+    if is_fresh(src, snapshot_dir):
+        return snap
+    with _locks_lock:
+        lock = _locks.setdefault(snap, threading.Lock())
+    with lock:
+        # Another thread may have converted it while we waited
+        if is_fresh(src, snapshot_dir):
+            return snap
+        try:
+            return convert(src, snapshot_dir)
+        except OSError:
+            return None
+
+
+def open_table(snap: Path) -> pa.Table:
+    """Zero-copy table over the memory-mapped snapshot."""
+    return pa.ipc.open_file(pa.memory_map(str(snap), "r")).read_all()
+
+
+def open_dataset(snap: Path) -> ds.Dataset:
+    """The snapshot as a dataset, for filtered/projected scans via recs.query()."""
+    return ds.dataset(str(snap), format="ipc")
+
+
+@metrics.timed("load.snapshot")
+def load_frame(snap: Path, source: str) -> pd.DataFrame:
+    """
+    Pandas view of a snapshot tagged with `source`. `split_blocks` keeps each
+    column in its own block so NaN-filled float32 columns stay views of the map.
+    """
+    df = open_table(snap).to_pandas(split_blocks=True)
+    df["__source__"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[source])
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert preset parquets into Arrow IPC snapshots.")
+    parser.add_argument("--force", action="store_true", help="convert even if the snapshot is current")
+    args = parser.parse_args(argv)
+    for preset, src in recs.preset_files(DATA_DIR).items():
+        if not asset_exists(src):
+            continue
+        if args.force or not is_fresh(src):
+            print(f"{preset}: {convert(src)}")
+        else:
+            print(f"{preset}: up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# utils/subgraph.py
+"""
+On-demand season and climate subgraphs, drawn with Plotly.
+
+Instead of the pipeline's pre-rendered PNGs (one per region and year that
+happened to be exported), the subgraph for any (crop, region, year) is cut
+out of the compiled knowledge graph through the evidence retriever
+(utils/evidence.py):
+
+* season view: Region -> ClimateWindow -> StageWindow, plus water-balance
+  and disease-risk nodes hanging off them;
+* climate view: one ClimateWindow with its Region and supported stages.
+
+Node positions come from a vectorised Fruchterman-Reingold layout that is
+cached on disk by a hash of the subgraph's nodes and edges, so the same
+subgraph is laid out once for every session and every worker.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils import evidence, graph, metrics
+from utils.paths import LAYOUT_DIR
+
+SEASON_SECTIONS = ("region", "climate", "stage", "water", "disease")
+
+# Colours follow the legend of the pipeline's PNG exports
+COLORS = {
+    "region": "#2b2d42",
+    "climate": "#1f77b4",
+    "stage": "#9e9e9e",
+    "water": "#17becf",
+    "disease": "#ff7f0e",
+    "plan": "#2ca02c",
+    "variety": "#9467bd",
+    "other": "#c7c7c7",
+}
+SIZES = {"region": 22, "climate": 18}
+DOTTED = {evidence.CLIMATE_SUPPORTS_STAGE}
+
+_layouts = OrderedDict()
+_layouts_lock = threading.Lock()
+_LAYOUT_CACHE = 64
+
+
+@metrics.cache_resource(show_spinner="Compiling knowledge graph…", max_entries=4)
+def evidence_index(crop: str, stamp=None) -> evidence.EvidenceIndex | None:
+    """Retriever over one crop's compiled graph (None without a GraphML export); `stamp` keys re-exports."""
+    g = graph.load_crop(crop)
+    return evidence.EvidenceIndex(g) if g is not None else None
+
+
+@metrics.cache_data(show_spinner=False, max_entries=16)
+def graph_choices(crop: str, stamp=None) -> tuple[list, list]:
+    """(region codes, years) offered for one crop graph."""
+    index = evidence_index(crop, stamp)
+    return choices(index) if index is not None else ([], [])
+
+
+def choices(index: evidence.EvidenceIndex) -> tuple[list, list]:
+    """(region codes, years) a crop graph has climate data for."""
+    g = index.g
+    regions = sorted({evidence.entity_key(g, i) for i in index.regions.tolist()})
+    climate = np.concatenate([g.nodes_of_type(t) for t in g.node_types if evidence.section_of(t) == "climate"]
+                             or [np.empty(0, dtype=np.int64)])
+    values = g.node_attr("year", climate) if len(climate) else None
+    if values is None:
+        found = {m for i in g.node_ids(climate) for m in re.findall(r"(?<!\d)(?:19|20)\d\d(?!\d)", i)}
+        years = sorted(int(y) for y in found)
+    elif isinstance(values, list):
+        years = sorted({int(str(v).split(".")[0]) for v in values if v and str(v).split(".")[0].isdigit()})
+    else:
+        years = sorted({int(v) for v in np.asarray(values) if not np.isnan(v)})
+    return regions, years
+
+
+# --- Extraction ---
+def _cut(nodes: pd.DataFrame, edges: pd.DataFrame, keep_ids) -> tuple[pd.DataFrame, pd.DataFrame]:
+    keep = set(keep_ids)
+    nodes = nodes[nodes["id"].isin(keep)]
+    edges = edges[edges["source"].isin(keep) & edges["target"].isin(keep)] if not edges.empty else edges
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True)
+
+
+def season_subgraph(pack: evidence.EvidencePack):
+    """Climate windows, stages, water balance and disease risk around the pack's region."""
+    if not pack.found:
+        return pack.nodes, pack.edges
+    return _cut(pack.nodes, pack.edges, pack.nodes.loc[pack.nodes["section"].isin(SEASON_SECTIONS), "id"])
+
+
+def climate_windows(pack: evidence.EvidencePack) -> list:
+    if not pack.found:
+        return []
+    return sorted(pack.nodes.loc[pack.nodes["section"] == "climate", "id"])
+
+
+def climate_subgraph(pack: evidence.EvidencePack, window: str):
+    """One climate window, its region and the stages it supports."""
+    e = pack.edges
+    stages = e.loc[(e["source"] == window) & (e["label"] == evidence.CLIMATE_SUPPORTS_STAGE), "target"]
+    return _cut(pack.nodes, pack.edges, [pack.region, window, *stages])
+
+
+# --- Layout ---
+def subgraph_hash(nodes: pd.DataFrame, edges: pd.DataFrame) -> str:
+    h = hashlib.blake2b(digest_size=12)
+    h.update("\n".join(sorted(nodes["id"])).encode())
+    if not edges.empty:
+        h.update("\n".join(sorted(edges["source"] + "\t" + edges["target"])).encode())
+    return h.hexdigest()
+
+
+def force_layout(n: int, src: np.ndarray, dst: np.ndarray, seed: int = 0, iters: int = 100) -> np.ndarray:
+    """Fruchterman-Reingold positions in [-1, 1]^2, all pairwise forces in one array op per step."""
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-1.0, 1.0, (n, 2))
+    if n < 2:
+        return pos * 0.0
+    k = 1.0 / np.sqrt(n)
+    step = 0.1
+    for _ in range(iters):
+        delta = pos[:, None, :] - pos[None, :, :]
+        dist = np.maximum(np.linalg.norm(delta, axis=2), 1e-3)
+        disp = (delta * (k * k / dist ** 2)[:, :, None]).sum(axis=1)
+        if len(src):
+            d = pos[src] - pos[dst]
+            length = np.maximum(np.linalg.norm(d, axis=1, keepdims=True), 1e-3)
+            pull = d * (length / k)
+            np.add.at(disp, src, -pull)
+            np.add.at(disp, dst, pull)
+        norm = np.maximum(np.linalg.norm(disp, axis=1, keepdims=True), 1e-9)
+        pos += disp / norm * np.minimum(norm, step)
+        step *= 0.95
+    pos -= pos.mean(axis=0)
+    return pos / max(np.abs(pos).max(), 1e-9)
+
+
+def layout(nodes: pd.DataFrame, edges: pd.DataFrame, layout_dir: Path = LAYOUT_DIR) -> dict:
+    """{node id: (x, y)}, computed once per distinct subgraph (memory LRU, then disk)."""
+    key = subgraph_hash(nodes, edges)
+    with _layouts_lock:
+        if key in _layouts:
+            _layouts.move_to_end(key)
+            metrics.cache_event("subgraph.layout", "hit")
+            return _layouts[key]
+    metrics.cache_event("subgraph.layout", "miss")
+
+    ids = sorted(nodes["id"])
+    path = Path(layout_dir) / f"{key}.npy"
+    try:
+        pos = np.load(path)
+        if pos.shape != (len(ids), 2):
+            raise ValueError(path)
+        metrics.cache_event("subgraph.layout_disk", "hit", kind="disk")
+    except (OSError, ValueError):
+        metrics.cache_event("subgraph.layout_disk", "miss", kind="disk")
+        at = {nid: i for i, nid in enumerate(ids)}
+        src = np.array([at[s] for s in edges["source"]], dtype=np.int64) if not edges.empty else np.empty(0, int)
+        dst = np.array([at[t] for t in edges["target"]], dtype=np.int64) if not edges.empty else np.empty(0, int)
+        with metrics.span("image.layout"):
+            pos = force_layout(len(ids), src, dst, seed=int(key[:8], 16)).astype(np.float32)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as fh:
+                np.save(fh, pos)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    result = {nid: (float(x), float(y)) for nid, (x, y) in zip(ids, pos)}
+    with _layouts_lock:
+        _layouts[key] = result
+        _layouts.move_to_end(key)
+        while len(_layouts) > _LAYOUT_CACHE:
+            _layouts.popitem(last=False)
+            metrics.cache_event("subgraph.layout", "eviction")
+    return result
+
+
+# --- Figure ---
+def _hover(row: pd.Series) -> str:
+    attrs = [f"{k}: {v}" for k, v in row.items()
+             if k not in ("id", "type", "section", "hop") and pd.notna(v)][:8]
+    return "<br>".join([f"<b>{row['id']}</b>", row["type"], *attrs])
+
+
+@metrics.timed("image.subgraph")
+def figure(nodes: pd.DataFrame, edges: pd.DataFrame, title: str = "", height: int = 640) -> go.Figure:
+    """Interactive node-link figure; one legend entry per node section and edge label."""
+    pos = layout(nodes, edges)
+    fig = go.Figure()
+    if not edges.empty:
+        for label, grp in edges.groupby("label", observed=True, sort=True):
+            xs, ys = [], []
+            for s, t in zip(grp["source"], grp["target"]):
+                xs += [pos[s][0], pos[t][0], None]
+                ys += [pos[s][1], pos[t][1], None]
+            fig.add_trace(go.Scatter(
+                x=xs, y=ys, mode="lines", name=str(label), hoverinfo="skip",
+                line=dict(width=1, color="#b0b0b0", dash="dot" if label in DOTTED else "solid"),
+            ))
+    for section, grp in nodes.groupby("section", sort=False):
+        fig.add_trace(go.Scatter(
+            x=[pos[i][0] for i in grp["id"]], y=[pos[i][1] for i in grp["id"]],
+            mode="markers", name=section,
+            marker=dict(size=SIZES.get(section, 10), color=COLORS.get(section, COLORS["other"]),
+                        line=dict(width=1, color="white")),
+            text=[_hover(r) for _, r in grp.iterrows()], hoverinfo="text",
+        ))
+    fig.update_layout(
+        title=title, height=height, showlegend=True, hovermode="closest",
+        margin=dict(l=10, r=10, t=40 if title else 10, b=10),
+        xaxis=dict(visible=False), yaxis=dict(visible=False, scaleanchor="x"),
+        plot_bgcolor="white",
+    )
+    return fig
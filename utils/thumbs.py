@@ -0,0 +1,177 @@
+# utils/thumbs.py
+"""
+Disk-cached, downscaled renditions of the graph snapshots.
+
+Galleries ask for `thumbnail(path, width)` and get a WebP (PNG if Pillow lacks
+WebP support) at the smallest standard width that covers the request. The
+file name carries the source's size and mtime, so a re-exported snapshot gets
+a fresh rendition. The cache directory is kept under MAX_CACHE_BYTES by
+evicting the least recently used renditions.
+
+To render every image up front (e.g. before deploying on a slow mount):
+
+    python -m utils.thumbs build
+    python -m utils.thumbs build --kind season --width 1280
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, features
+
+from utils import metrics
+from utils.paths import DATA_DIR, THUMB_DIR, asset_stamp, manifest, open_asset
+
+# Standard rendition widths (px); requests are rounded up to one of these
+WIDTHS = (320, 640, 1280)
+
+# Gallery cells are at most ~700 CSS px wide; 640 stays sharp without shipping megabytes
+GALLERY_WIDTH = 640
+
+# Width the app shows each image kind at, where it is not a gallery cell
+KIND_WIDTHS = {"schema": 1280}
+
+MAX_CACHE_BYTES = 512 * 2**20
+
+# Refresh a rendition's mtime (its LRU clock) at most this often, to spare the mount
+TOUCH_INTERVAL = 3600
+
+_FORMAT = ("WEBP", "webp") if features.check("webp") else ("PNG", "png")
+_SAVE_OPTS = {"quality": 82, "method": 4} if _FORMAT[0] == "WEBP" else {"optimize": True}
+_lock = threading.Lock()
+_bytes_written = 0
+
+# Renditions known to exist -> when this process last touched them (skips a stat per image)
+_known: dict = {}
+
+
+def pick_width(width: int) -> int:
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def thumb_path(src: Path, width: int, stamp) -> Path:
+    h = hashlib.blake2b(f"{src}|{stamp}".encode(), digest_size=6).hexdigest()
+    return THUMB_DIR / f"{src.stem}.{width}.{h}.{_FORMAT[1]}"
+
+
+@metrics.timed("image.thumbnail")
+def thumbnail(src: Path, width: int = GALLERY_WIDTH) -> Path:
+    """
+    Path of a rendition of `src` at least `width` px wide (never upscaled).
+    Falls back to `src` itself if it cannot be decoded or the cache is not writable.
+    """
+    src = Path(src)
+    stamp = asset_stamp(src)
+    if stamp is None:
+        return src
+    w = pick_width(width)
+    out = thumb_path(src, w, stamp)
+    now = time.time()
+    if now - _known.get(out, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+        metrics.cache_event("thumbs.thumbnail", "hit", kind="disk")
+        return out
+    try:
+        if now - out.stat().st_mtime > TOUCH_INTERVAL:
+            os.utime(out)
+        _known[out] = now
+        metrics.cache_event("thumbs.thumbnail", "hit", kind="disk")
+        return out
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return src
+
+    metrics.cache_event("thumbs.thumbnail", "miss", kind="disk")
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open_asset(src) as fh, Image.open(fh) as im:
+            im.thumbnail((w, 10 * w), Image.Resampling.LANCZOS)
+            if _FORMAT[0] == "WEBP" and im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA")
+            out.parent.mkdir(parents=True, exist_ok=True)
+            im.save(tmp, format=_FORMAT[0], **_SAVE_OPTS)
+        os.replace(tmp, out)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        tmp.unlink(missing_ok=True)
+        return src
+
+    _known[out] = now
+    _account(out.stat().st_size)
+    return out
+
+
+def forget(out: Path):
+    """Drop a rendition from the in-process "known to exist" set."""
+    _known.pop(Path(out), None)
+
+
+def _account(n: int):
+    """Run an eviction pass after roughly every 10% of the budget written."""
+    global _bytes_written
+    with _lock:
+        _bytes_written += n
+        due = _bytes_written >= MAX_CACHE_BYTES // 10
+        if due:
+            _bytes_written = 0
+    if due:
+        evict()
+
+
+def evict(max_bytes: int = MAX_CACHE_BYTES) -> int:
+    """Delete least recently used renditions until the cache is under 90% of `max_bytes`."""
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(THUMB_DIR) if e.is_file()]
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= 0.9 * max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _known.pop(Path(path), None)
+        total -= size
+        removed += 1
+    metrics.cache_event("thumbs.thumbnail", "eviction", removed, kind="disk")
+    return removed
+
+
+def build(kinds=None, widths=None, workers: int = 8) -> tuple[int, int]:
+    """
+    Render every image in the manifest (only `kinds` if given; "crop" includes its
+    variants) at `widths`, by default the width the app shows it at.
+    Returns (renditions ready, renditions that could not be made).
+    """
+    rows = [r for r in manifest().query() if r["name"].endswith(".png")
+            and (not kinds or r["kind"] in kinds or r["kind"].split("_")[0] in kinds)]
+    jobs = [(DATA_DIR / r["name"], w) for r in rows for w in (widths or [KIND_WIDTHS.get(r["kind"], GALLERY_WIDTH)])]
+    with ThreadPoolExecutor(workers) as pool:
+        outs = list(pool.map(lambda job: thumbnail(*job), jobs))
+    failed = sum(out == src for out, (src, _) in zip(outs, jobs))
+    return len(jobs) - failed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render thumbnails of the graph snapshots.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="render every image of the manifest into the thumbnail cache")
+    b.add_argument("--kind", action="append", help="only this image kind, e.g. crop, season, climate, schema "
+                   "(repeatable)")
+    b.add_argument("--width", action="append", type=int, help="rendition width in px (repeatable; default: "
+                   "the width the app shows each kind at)")
+    b.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    ready, failed = build(args.kind, args.width, args.workers)
+    print(f"{ready} renditions in {THUMB_DIR}" + (f", {failed} images could not be rendered" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# utils/vectors.py
+"""
+Local vector index over the knowledge-graph entities, for semantic search.
+
+Every node of every crop graph is turned into a short text (type, id and
+attributes) and embedded with signed feature hashing of words and character
+trigrams: deterministic, dependency-free and good at fuzzy name matching
+("ashanti" -> "Ashanti Red", "flower" -> "FloweringStage").
+
+Embeddings are built once per crop graph and stored as a segment under
+`_app_cache/vectors/<crop>-<hash>/` (keyed by the GraphML's size and mtime,
+so only re-exported crops are re-embedded):
+
+    vecs.npy      float32 [n, DIM], L2-normalised, memory-mapped at query time
+    nodes.npy     int32 node index in the compiled crop graph
+    q8.npy        int8 quantised copy of vecs, scale.npy per-row scales
+    centroids.npy IVF cluster centres; rows are stored grouped by cluster
+    offsets.npy   start row of each cluster
+
+Small segments are searched exhaustively; large ones probe the nearest IVF
+clusters on the int8 copy and re-rank the shortlist in float32.
+
+    python -m utils.vectors build
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils import graph as kg, metrics
+from utils.paths import VECTOR_DIR, asset_stat, graph_crops, graphml
+
+FORMAT_VERSION = 1
+DIM = 256
+
+# Segments smaller than this are always searched exhaustively
+IVF_MIN_ROWS = 4096
+N_PROBE = 8
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# --- Embedding ---
+def _features(text: str):
+    """(bucket, signed weight) pairs for words and padded character trigrams."""
+    for w in _WORD.findall(text.lower()):
+        h = zlib.crc32(w.encode())
+        yield h % DIM, 2.0 if h & 0x80000000 else -2.0
+        padded = f"#{w}#"
+        for j in range(len(padded) - 2):
+            h = zlib.crc32(padded[j:j + 3].encode(), 0x9E3779B9)
+            yield h % DIM, 1.0 if h & 0x80000000 else -1.0
+
+
+def embed(texts) -> np.ndarray:
+    """L2-normalised float32 [len(texts), DIM] embeddings."""
+    rows, cols, vals = [], [], []
+    for r, text in enumerate(texts):
+        for c, v in _features(text):
+            rows.append(r)
+            cols.append(c)
+            vals.append(v)
+    out = np.zeros((len(texts), DIM), dtype=np.float32)
+    np.add.at(out, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)),
+              np.asarray(vals, dtype=np.float32))
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.maximum(norms, 1e-6)
+
+
+def node_text(g: kg.CropGraph, i: int) -> str:
+    """What a node is searchable by: its type, id and attribute values."""
+    attrs = g.node_attrs(i)
+    parts = [attrs.pop("type"), attrs.pop("id").replace(":", " ").replace("_", " ")]
+    parts += [f"{k} {v}" for k, v in attrs.items() if isinstance(v, str)]
+    # CamelCase types ("StageWindow") also match their words
+    parts[0] = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", parts[0])
+    return " ".join(parts)
+
+
+# --- IVF / quantisation ---
+def _kmeans(x: np.ndarray, k: int, iters: int = 8, sample: int = 20000) -> np.ndarray:
+    """Spherical k-means centroids (deterministic)."""
+    rng = np.random.default_rng(0)
+    pts = x[rng.choice(len(x), min(len(x), sample), replace=False)]
+    cent = pts[rng.choice(len(pts), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(pts @ cent.T, axis=1)
+        sums = np.zeros_like(cent)
+        np.add.at(sums, assign, pts)
+        empty = np.bincount(assign, minlength=k) == 0
+        sums[empty] = cent[empty]
+        cent = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-6)
+    return cent.astype(np.float32)
+
+
+def quantise(x: np.ndarray):
+    """Symmetric per-row int8 quantisation: x ~= q8 * scale[:, None]."""
+    scale = np.maximum(np.abs(x).max(axis=1), 1e-6) / 127.0
+    q8 = np.clip(np.rint(x / scale[:, None]), -127, 127).astype(np.int8)
+    return q8, scale.astype(np.float32)
+
+
+def build_segment(g: kg.CropGraph) -> dict:
+    """Embed every node of `g`; returns the segment's arrays."""
+    vecs = embed([node_text(g, i) for i in range(g.n_nodes)])
+    nodes = np.arange(g.n_nodes, dtype=np.int32)
+    arrays = {}
+    if len(vecs) >= IVF_MIN_ROWS:
+        k = int(min(256, np.sqrt(len(vecs))))
+        cent = _kmeans(vecs, k)
+        assign = np.argmax(vecs @ cent.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        vecs, nodes = vecs[order], nodes[order]
+        offsets = np.zeros(k + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=k), out=offsets[1:])
+        arrays.update(centroids=cent, offsets=offsets)
+    q8, scale = quantise(vecs)
+    arrays.update(vecs=vecs, nodes=nodes, q8=q8, scale=scale)
+    return arrays
+
+
+# --- Segments on disk ---
+def segment_dir(src: Path, stamp, vector_dir: Path = VECTOR_DIR) -> Path:
+    h = hashlib.blake2b(f"{src}|{stamp}|{FORMAT_VERSION}|{DIM}".encode(), digest_size=6).hexdigest()
+    return Path(vector_dir) / f"{Path(src).stem}-{h}"
+
+
+def _save(out: Path, arrays: dict, meta: dict, prefix: str):
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, arr in arrays.items():
+        np.save(tmp / f"{name}.npy", arr)
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    try:
+        os.rename(tmp, out)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for old in out.parent.glob(f"{prefix}-*"):
+        if old != out and old.is_dir() and old.name.rsplit("-", 1)[0] == prefix:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _open(out: Path) -> dict:
+    return {p.stem: np.load(p, mmap_mode="r") for p in out.glob("*.npy")}
+
+
+def load_segment(crop: str, g: kg.CropGraph, vector_dir: Path = VECTOR_DIR) -> dict:
+    """Segment arrays for one crop, embedding its graph only if it changed since the last build."""
+    src = graphml(crop)
+    out = segment_dir(src, asset_stat(src), vector_dir)
+    try:
+        return _open(out) if (out / "meta.json").exists() else _build(out, src, crop, g)
+    except (OSError, ValueError):
+        return build_segment(g)
+
+
+def _build(out: Path, src: Path, crop: str, g: kg.CropGraph) -> dict:
+    arrays = build_segment(g)
+    try:
+        _save(out, arrays, {"version": FORMAT_VERSION, "crop": crop, "dim": DIM}, src.stem)
+        return _open(out)
+    except OSError:
+        return arrays
+
+
+# --- Search ---
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def search_segment(seg: dict, q: np.ndarray, k: int, mode: str = "auto", n_probe: int = N_PROBE):
+    """(rows, scores) of the best `k` rows of one segment for query vector `q`."""
+    if mode == "exact" or "centroids" not in seg:
+        scores = seg["vecs"] @ q
+        rows = _top(scores, k)
+        return rows, scores[rows]
+    # IVF: probe the closest clusters on the int8 copy, re-rank a shortlist exactly
+    cent, offsets = seg["centroids"], seg["offsets"]
+    probe = _top(cent @ q, n_probe)
+    cand = np.concatenate([np.arange(offsets[c], offsets[c + 1]) for c in probe])
+    if not len(cand):
+        return cand, np.empty(0, dtype=np.float32)
+    approx = (seg["q8"][cand].astype(np.float32) @ q) * seg["scale"][cand]
+    short = cand[_top(approx, 4 * k)]
+    exact = seg["vecs"][short] @ q
+    best = _top(exact, k)
+    return short[best], exact[best]
+
+
+class VectorIndex:
+    """Search over the per-crop segments; share one instance through st.cache_resource."""
+
+    def __init__(self, crops=None, vector_dir: Path = VECTOR_DIR):
+        crops = list(crops) if crops is not None else graph_crops()
+        self.graphs, self.segments = {}, {}
+        for crop in crops:
+            g = kg.load_crop(crop)
+            if g is None:
+                continue
+            self.graphs[crop] = g
+            self.segments[crop] = load_segment(crop, g, vector_dir)
+
+    def __len__(self) -> int:
+        return sum(len(s["nodes"]) for s in self.segments.values())
+
+    @metrics.timed("graph.search")
+    def search(self, query: str, k: int = 10, node_types=None, mode: str = "auto") -> pd.DataFrame:
+        """Top-k entities across all crops: crop, id, type, score, node (graph index)."""
+        cols = ["crop", "id", "type", "score", "node"]
+        if not query.strip() or not self.segments:
+            return pd.DataFrame(columns=cols)
+        q = embed([query])[0]
+        hits = []
+        # Over-fetch when filtering by type so the filter rarely empties the result
+        fetch = k * 5 if node_types else k
+        for crop, seg in self.segments.items():
+            g = self.graphs[crop]
+            rows, scores = search_segment(seg, q, fetch, mode)
+            for node, score in zip(np.asarray(seg["nodes"])[rows].tolist(), scores.tolist()):
+                t = g.type_of(node)
+                if node_types and t not in node_types:
+                    continue
+                hits.append((crop, g.node_id(node), t, float(score), node))
+        df = pd.DataFrame(hits, columns=cols)
+        return df.sort_values("score", ascending=False, kind="stable").head(k).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the entity vector index (one segment per crop graph).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="embed new or changed crop graphs")
+    b.add_argument("--crop", action="append", help="crop to index (repeatable)")
+    q = sub.add_parser("search", help="query the index")
+    q.add_argument("query")
+    q.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    index = VectorIndex(args.crop if args.cmd == "build" else None)
+    if args.cmd == "build":
+        for crop, seg in index.segments.items():
+            kind = "IVF" if "centroids" in seg else "exact"
+            print(f"{crop}: {len(seg['nodes'])} entities ({kind})")
+    else:
+        print(index.search(args.query, args.k).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()